@@ -0,0 +1,56 @@
+"""PageXML coords benchmark
+
+Usage:
+    bench_coords.py [--points <number>] [--repeat <number>]
+
+Options:
+    --points <number>       Points per polygon. [default: 300]
+    --repeat <number>       Parsed and formatted polygons per implementation. [default: 2000]
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy
+from docopt import docopt
+
+sys.path.insert(0, Path(__file__).absolute().parent.parent.as_posix())
+
+from tesspage.coords import format_points, parse_points  # noqa: E402
+
+
+def legacy_parse(points: str) -> list:
+    return [[int(x) for x in y.split(',')] for y in points.split(' ')]
+
+
+def legacy_format(coords) -> str:
+    points = ''
+    for point in coords:
+        points += f'{point[0]},{point[1]} '
+    return points.strip()
+
+
+def timed(fn, arg, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(arg)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    args = docopt(__doc__)
+    points, repeat = int(args.get('--points')), int(args.get('--repeat'))
+
+    coords = numpy.random.default_rng(0).integers(0, 10000, size=(points, 2), dtype=numpy.int32)
+    string = ' '.join(f'{x},{y}' for x, y in coords.tolist())
+    assert parse_points(string).tolist() == legacy_parse(string)
+    assert format_points(coords) == legacy_format(coords) == string
+
+    for name, legacy, vectorized, arg in (('parse', legacy_parse, parse_points, string),
+                                          ('format', legacy_format, format_points, coords)):
+        old, new = timed(legacy, arg, repeat), timed(vectorized, arg, repeat)
+        print(f'{name:>6}: legacy {old:.3f}s, vectorized {new:.3f}s ({old / new:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""Corpus benchmark suite
+
+Runs the main code paths on a synthetic corpus (see corpus.py) and reports throughput and peak RSS. Every benchmark
+runs in a fresh process, so peak RSS belongs to a single benchmark. With --compare the run fails (exit status 1) if a
+benchmark is slower or uses more memory than the baseline by more than the threshold.
+
+Usage:
+    bench_corpus.py [--pages <number>] [--lines <number>] [--points <number>] [--width <px>] [--height <px>] [--seed <number>] [--repeat <number>] [--only <names>] [--output <file>] [--compare <file>] [--threshold <fraction>]
+
+Options:
+    --pages <number>        Number of pages. [default: 20]
+    --lines <number>        Text lines per page. [default: 40]
+    --points <number>       Points per line polygon. [default: 20]
+    --width <px>            Page image width. [default: 2000]
+    --height <px>           Page image height. [default: 2800]
+    --seed <number>         Random seed. [default: 0]
+    --repeat <number>       Repetitions per benchmark, best time is reported. [default: 3]
+    --only <names>          Comma separated benchmark names.
+    --output <file>         Write results to .json file (baseline for --compare).
+    --compare <file>        Baseline .json file of an earlier run.
+    --threshold <fraction>  Tolerated regression of throughput and peak RSS. [default: 0.15]
+"""
+import json
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from pathlib import Path
+
+from docopt import docopt
+
+sys.path.insert(0, Path(__file__).absolute().parent.parent.as_posix())
+sys.path.insert(0, Path(__file__).absolute().parent.as_posix())
+
+from corpus import config_from_args, write_corpus  # noqa: E402
+
+
+def bench_parse_pagexml(corpus: Path, tmp: Path):
+    from tesspage.pagexml_parser import parse_pagexml
+    files = sorted(corpus.joinpath('pagexml').glob('*.xml'))
+    return lambda: [parse_pagexml(f) for f in files]
+
+
+def bench_parse_hocr(corpus: Path, tmp: Path):
+    from tesspage.hocr_parser import parse_hocr
+    files = sorted(corpus.joinpath('hocr').glob('*.hocr'))
+    return lambda: [parse_hocr(f) for f in files]
+
+
+def bench_xml_to_line_gt(corpus: Path, tmp: Path):
+    from tesspage.converter import xml_to_line_gt
+    from tesspage.pagexml_parser import parse_pagexml
+    documents = [parse_pagexml(f) for f in sorted(corpus.joinpath('pagexml').glob('*.xml'))]
+
+    def run():
+        for doc in documents:
+            xml_to_line_gt(doc, tmp)
+    return run
+
+
+def bench_build_xml_file(corpus: Path, tmp: Path):
+    from tesspage.hocr_parser import parse_hocr
+    from tesspage.pagexml_builder import build_xml_file
+    documents = [parse_hocr(f) for f in sorted(corpus.joinpath('hocr').glob('*.hocr'))]
+    return lambda: [build_xml_file(doc, tmp.joinpath(f'{i}.xml')) for i, doc in enumerate(documents)]
+
+
+def bench_evaluate(corpus: Path, tmp: Path, line_level: bool = False):
+    from tesspage.eval import eval_worker, prediction_file
+    tasks = [(ref, prediction_file(ref), line_level) for ref in sorted(corpus.joinpath('eval').glob('*.gt.xml'))]
+
+    def run():
+        for task in tasks:
+            _, error = eval_worker(task)
+            if error is not None:
+                raise RuntimeError(error)
+    return run
+
+
+BENCHMARKS = {
+    'parse_pagexml': bench_parse_pagexml,
+    'parse_hocr': bench_parse_hocr,
+    'xml_to_line_gt': bench_xml_to_line_gt,
+    'build_xml_file': bench_build_xml_file,
+    'evaluate': bench_evaluate,
+    'evaluate_lines': lambda corpus, tmp: bench_evaluate(corpus, tmp, line_level=True),
+}
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == 'darwin' else rss / 1024  # bytes on macOS, KiB on Linux
+
+
+def run_benchmark(name: str, corpus: Path, repeat: int) -> dict:
+    """
+    Runs a single benchmark, called in a fresh process
+
+    Args:
+        name: key of BENCHMARKS
+        corpus: corpus folder
+        repeat: repetitions, best time is reported
+
+    Returns:
+        {'seconds': best time, 'peak_rss_mb': peak RSS of the process}
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        run = BENCHMARKS[name](corpus, Path(tmp))
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+    return {'seconds': best, 'peak_rss_mb': peak_rss_mb()}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Compares results to a baseline run
+
+    Args:
+        results: benchmark results of this run
+        baseline: benchmark results of an earlier run
+        threshold: tolerated regression as fraction
+
+    Returns:
+        list of regression messages
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        if result['lines_per_s'] < old['lines_per_s'] * (1 - threshold):
+            regressions.append(f'{name}: {result["lines_per_s"]:.0f} lines/s, baseline {old["lines_per_s"]:.0f} lines/s')
+        if result['peak_rss_mb'] > old['peak_rss_mb'] * (1 + threshold):
+            regressions.append(f'{name}: {result["peak_rss_mb"]:.0f}MB peak RSS, baseline {old["peak_rss_mb"]:.0f}MB')
+    return regressions
+
+
+def main() -> None:
+    args = docopt(__doc__)
+    config = config_from_args(args)
+    repeat = int(args.get('--repeat'))
+    names = args.get('--only').split(',') if args.get('--only') else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        sys.exit(f'Unknown benchmark(s): {", ".join(unknown)}')
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = Path(tmp)
+        counts = write_corpus(corpus, config)
+        print(f'Corpus: {counts["pages"]} page(s), {counts["lines"]} line(s), {config.points} points per line')
+        for name in names:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                result = pool.submit(run_benchmark, name, corpus, repeat).result()
+            result['pages_per_s'] = counts['pages'] / result['seconds']
+            result['lines_per_s'] = counts['lines'] / result['seconds']
+            results[name] = result
+            print(f'{name:>15}: {result["seconds"]:.3f}s, {result["pages_per_s"]:.1f} pages/s, '
+                  f'{result["lines_per_s"]:.0f} lines/s, {result["peak_rss_mb"]:.0f}MB peak RSS')
+
+    if args.get('--output'):
+        with open(args.get('--output'), 'w', encoding='utf-8') as f:
+            json.dump({'config': asdict(config), 'results': results}, f, indent=2)
+
+    if args.get('--compare'):
+        with open(args.get('--compare'), 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('config') != asdict(config):
+            print('Warning: baseline was run with a different corpus configuration')
+        regressions = compare(results, baseline.get('results', {}), float(args.get('--threshold')))
+        if regressions:
+            print('Regressions:\n\t' + '\n\t'.join(regressions))
+            sys.exit(1)
+        print('No regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""hOCR parser benchmark
+
+Usage:
+    bench_hocr.py [--lines <number>] [--words <number>] [--repeat <number>]
+
+Options:
+    --lines <number>        Number of lines in the synthetic hOCR file. [default: 5000]
+    --words <number>        Words per line. [default: 8]
+    --repeat <number>       Repetitions per backend, best time is reported. [default: 3]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from docopt import docopt
+
+sys.path.insert(0, Path(__file__).absolute().parent.parent.as_posix())
+
+from tesspage.hocr_parser import HOCR_BACKENDS  # noqa: E402
+
+
+def synthetic_hocr(lines: int, words: int) -> str:
+    """
+    Builds a tesseract like hOCR document
+
+    Args:
+        lines: number of lines
+        words: words per line
+
+    Returns:
+        hOCR string
+    """
+    body = []
+    for i in range(lines):
+        if i % 20 == 0:
+            if i:
+                body.append('</p></div>')
+            body.append(f"<div class='ocr_carea' id='block_1_{i}' title=\"bbox 10 {i * 40} 2000 {i * 40 + 800}\">"
+                        f"<p class='ocr_par' id='par_1_{i}' lang='eng'>")
+        body.append(f"<span class='ocr_line' id='line_1_{i}' title=\"bbox 10 {i * 40} 2000 {i * 40 + 38}; "
+                    f"baseline 0 -8; x_size 30; x_descenders 7; x_ascenders 8\">")
+        for j in range(words):
+            body.append(f"<span class='ocrx_word' id='word_1_{i}_{j}' title='bbox {10 + j * 200} {i * 40} "
+                        f"{180 + j * 200} {i * 40 + 38}; x_wconf {90 + j % 10}'>word{j}</span> ")
+        body.append('</span>')
+    body.append('</p></div>')
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en"><head><title></title>'
+            "<meta name='ocr-system' content='tesseract 5.3.0' /></head><body>"
+            f"<div class='ocr_page' id='page_1' title='image \"synthetic.png\"; bbox 0 0 2100 {lines * 40 + 800}; "
+            "ppageno 0'>" + ''.join(body) + '</div></body></html>')
+
+
+def main() -> None:
+    args = docopt(__doc__)
+    lines, words, repeat = int(args.get('--lines')), int(args.get('--words')), int(args.get('--repeat'))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp).joinpath('synthetic.hocr')
+        path.write_text(synthetic_hocr(lines, words), encoding='utf-8')
+
+        results = {}
+        for name, parser in HOCR_BACKENDS.items():
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                parser(path)
+                best = min(best, time.perf_counter() - start)
+            results[name] = best
+            print(f'{name:>5}: {best:.3f}s ({lines / best:.0f} lines/s)')
+        print(f'speedup: {results["bs4"] / results["lxml"]:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""CLI startup benchmark
+
+Measures the cold start of tesspage.py subcommands with python -X importtime. Exits with status 1 if a subcommand
+exceeds its import time budget or loads a heavy dependency it does not need. tests/test_startup.py checks the same
+budgets in the test suite.
+
+Usage:
+    bench_startup.py [--repeat <number>] [--budget <ms>] [--heavy_budget <ms>]
+
+Options:
+    --repeat <number>       Runs per subcommand, best run is reported. [default: 5]
+    --budget <ms>           Import time budget of --help, unpack and tesseract in ms. [default: 50]
+    --heavy_budget <ms>     Import time budget of generate, eval and index in ms. [default: 600]
+"""
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from docopt import docopt
+
+CLI = Path(__file__).absolute().parent.parent.joinpath('tesspage.py')
+
+# heavy dependencies, only subcommands using them may import them
+HEAVY = ('cv2', 'numpy', 'lxml', 'bs4', 'dinglehopper', 'rapidfuzz', 'uniseg')
+
+
+def scenarios(tmp: Path) -> dict:
+    """
+    Subcommand calls returning right after startup
+
+    Args:
+        tmp: empty folder
+
+    Returns:
+        {name: (cli args, allowed heavy dependencies, light subcommand)}
+    """
+    missing = tmp.joinpath('missing').as_posix()
+    return {
+        'help': (['--help'], (), True),
+        'unpack': (['unpack', '--archive', missing, '--ground_truth', tmp.as_posix()], (), True),
+        'tesseract': (['tesseract', '--model_name', 'foo', '--input', missing], (), True),
+        'generate': (['generate', '--training_data', tmp.as_posix(), '--ground_truth', tmp.joinpath('gt').as_posix()],
+                     ('cv2', 'numpy', 'lxml'), False),
+        'eval': (['eval', '--eval_input', tmp.as_posix(), '--no_cache'], tuple(p for p in HEAVY if p != 'bs4'), False),
+        'index': (['index', '--training_data', tmp.as_posix(), '--database', tmp.joinpath('corpus.sqlite').as_posix()],
+                  ('numpy', 'lxml'), False),
+    }
+
+
+def import_profile(args: list) -> tuple:
+    """
+    Runs python once with -X importtime
+
+    Args:
+        args: interpreter arguments after -X importtime
+
+    Returns:
+        (import time of all top level imports in us, set of imported top level packages)
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    total, packages = 0, set()
+    for row in result.stderr.splitlines():
+        if not row.startswith('import time:') or 'cumulative' in row:
+            continue
+        _, cumulative, name = row[len('import time:'):].split('|')
+        packages.add(name.strip().split('.')[0])
+        if not name.startswith('  '):  # top level import, nested imports are part of its cumulative time
+            total += int(cumulative)
+    return total, packages
+
+
+def best_profile(args: list, repeat: int) -> tuple:
+    runs = [import_profile(args) for _ in range(repeat)]
+    return min(total for total, _ in runs), set.union(*(packages for _, packages in runs))
+
+
+def main() -> None:
+    args = docopt(__doc__)
+    repeat, budget, heavy_budget = int(args.get('--repeat')), float(args.get('--budget')), float(args.get('--heavy_budget'))
+
+    baseline, baseline_packages = best_profile(['-c', 'pass'], repeat)  # interpreter and site imports
+    print(f'{"interpreter":>11}: {baseline / 1000:7.1f}ms')
+
+    failed = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, (cli_args, allowed, light) in scenarios(Path(tmp)).items():
+            start = time.perf_counter()
+            total, packages = best_profile([CLI.as_posix()] + cli_args, repeat)
+            wall = (time.perf_counter() - start) / repeat
+            ms = max(total - baseline, 0) / 1000
+            limit = budget if light else heavy_budget
+            unexpected = sorted(p for p in HEAVY if p in packages - baseline_packages and p not in allowed)
+            print(f'{name:>11}: {ms:7.1f}ms imports (budget {limit:.0f}ms), {wall * 1000:.0f}ms per run'
+                  + (f', unexpected: {", ".join(unexpected)}' if unexpected else ''))
+            if ms > limit or unexpected:
+                failed.append(name)
+
+    if failed:
+        print(f'Startup regression: {", ".join(failed)}')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
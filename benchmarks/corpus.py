@@ -0,0 +1,225 @@
+"""Synthetic corpus generator
+
+Writes deterministic page images with matching PageXML and hOCR files, plus PageXML evaluation pairs with a noisy
+prediction. Equal arguments always produce identical files.
+
+Usage:
+    corpus.py <folder> [--pages <number>] [--lines <number>] [--points <number>] [--width <px>] [--height <px>] [--seed <number>]
+
+Options:
+    --pages <number>        Number of pages (one document per page). [default: 20]
+    --lines <number>        Text lines per page. [default: 40]
+    --points <number>       Points per line polygon (polygon complexity), at least 4. [default: 20]
+    --width <px>            Page image width. [default: 2000]
+    --height <px>           Page image height. [default: 2800]
+    --seed <number>         Random seed. [default: 0]
+"""
+import html
+from dataclasses import dataclass
+from pathlib import Path
+
+import cv2
+import numpy
+from docopt import docopt
+
+ALPHABET = 'abcdefghijklmnopqrstuvwxyzäöüß'
+LINES_PER_REGION = 10
+MARGIN = 50
+
+
+@dataclass()
+class CorpusConfig:
+    pages: int = 20
+    lines: int = 40
+    points: int = 20
+    width: int = 2000
+    height: int = 2800
+    seed: int = 0
+
+
+def random_text(rng: numpy.random.Generator, words: int) -> str:
+    return ' '.join(''.join(rng.choice(list(ALPHABET), size=rng.integers(2, 10))) for _ in range(words))
+
+
+def noisy_text(rng: numpy.random.Generator, text: str, rate: float = 0.05) -> str:
+    """
+    Substitutes and deletes characters to simulate OCR errors
+    """
+    chars = []
+    for c in text:
+        r = rng.random()
+        if r < rate / 2:
+            continue
+        chars.append(rng.choice(list(ALPHABET)) if r < rate else c)
+    return ''.join(chars)
+
+
+def line_polygon(x0: int, y0: int, x1: int, y1: int, points: int) -> numpy.ndarray:
+    """
+    Polygon along the top and bottom edge of a line box, slightly wavy
+
+    Returns:
+        int array of shape (points, 2)
+    """
+    top = max(points // 2, 2)
+    bottom = max(points - top, 2)
+    xs_top = numpy.linspace(x0, x1, top)
+    xs_bottom = numpy.linspace(x1, x0, bottom)
+    wave = lambda xs: 2 * numpy.sin(xs / 37.0)  # noqa: E731
+    return numpy.concatenate([
+        numpy.stack([xs_top, y0 + wave(xs_top)], axis=1),
+        numpy.stack([xs_bottom, y1 + wave(xs_bottom)], axis=1),
+    ]).round().astype(int)
+
+
+def points_string(coords) -> str:
+    return ' '.join(f'{x},{y}' for x, y in coords)
+
+
+def synthetic_page(config: CorpusConfig, index: int) -> tuple:
+    """
+    Generates one page
+
+    Args:
+        config: corpus settings
+        index: page number
+
+    Returns:
+        (image, [(region id, region box, [(line id, line box, polygon, text, prediction)])])
+    """
+    rng = numpy.random.default_rng([config.seed, index])
+    img = numpy.full((config.height, config.width, 3), 255, dtype=numpy.uint8)
+    line_height = max((config.height - 2 * MARGIN) // max(config.lines, 1), 8)
+    regions = []
+    for i in range(config.lines):
+        if i % LINES_PER_REGION == 0:
+            regions.append((f'r{len(regions)}', None, []))
+        y0 = MARGIN + i * line_height
+        y1 = y0 + int(line_height * 0.8)
+        x1 = int(config.width - MARGIN - rng.integers(0, config.width // 4))
+        text = random_text(rng, int(rng.integers(4, 10)))
+        cv2.putText(img, text.encode('ascii', 'replace').decode(), (MARGIN, y1 - line_height // 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, line_height / 45, (0, 0, 0), max(line_height // 20, 1), cv2.LINE_AA)
+        polygon = line_polygon(MARGIN, y0, x1, y1, config.points)
+        regions[-1][2].append((f'r{len(regions) - 1}l{i}', (MARGIN, y0, x1, y1), polygon, text, noisy_text(rng, text)))
+
+    result = []
+    for region_id, _, lines in regions:
+        x0 = min(box[0] for _, box, _, _, _ in lines)
+        y0 = min(box[1] for _, box, _, _, _ in lines)
+        x1 = max(box[2] for _, box, _, _, _ in lines)
+        y1 = max(box[3] for _, box, _, _, _ in lines)
+        result.append((region_id, (x0, y0, x1, y1), lines))
+    return img, result
+
+
+def box_polygon(box: tuple) -> list:
+    x0, y0, x1, y1 = box
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+
+def pagexml(image_name: str, config: CorpusConfig, regions: list, prediction: bool = False) -> str:
+    """
+    PageXML document of a generated page
+
+    Args:
+        image_name: image file name
+        config: corpus settings
+        regions: regions of synthetic_page
+        prediction: use noisy texts
+
+    Returns:
+        PageXML string
+    """
+    body = []
+    for region_id, box, lines in regions:
+        body.append(f'<TextRegion id="{region_id}"><Coords points="{points_string(box_polygon(box))}"/>')
+        for line_id, _, polygon, text, noisy in lines:
+            body.append(f'<TextLine id="{line_id}"><Coords points="{points_string(polygon)}"/>'
+                        f'<TextEquiv><Unicode>{html.escape(noisy if prediction else text)}</Unicode></TextEquiv></TextLine>')
+        body.append('</TextRegion>')
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<PcGts xmlns="http://schema.primaresearch.org/PAGE/gts/pagecontent/2019-07-15">'
+            '<Metadata><Creator>tesspage benchmark</Creator><Created>2020-01-01T00:00:00</Created>'
+            '<LastChange>2020-01-01T00:00:00</LastChange></Metadata>'
+            f'<Page imageFilename="{image_name}" imageHeight="{config.height}" imageWidth="{config.width}">'
+            + ''.join(body) + '</Page></PcGts>\n')
+
+
+def hocr(image_name: str, config: CorpusConfig, regions: list) -> str:
+    """
+    Tesseract like hOCR document of a generated page (noisy texts, word boxes split the line box evenly)
+    """
+    body = []
+    for region_id, (x0, y0, x1, y1), lines in regions:
+        body.append(f"<div class='ocr_carea' id='block_{region_id}' title=\"bbox {x0} {y0} {x1} {y1}\">"
+                    f"<p class='ocr_par' id='par_{region_id}' lang='deu'>")
+        for line_id, (lx0, ly0, lx1, ly1), _, _, noisy in lines:
+            body.append(f"<span class='ocr_line' id='line_{line_id}' title=\"bbox {lx0} {ly0} {lx1} {ly1}; "
+                        f"baseline 0 -8; x_size 30; x_descenders 7; x_ascenders 8\">")
+            words = noisy.split(' ')
+            step = (lx1 - lx0) / max(len(words), 1)
+            for j, word in enumerate(words):
+                body.append(f"<span class='ocrx_word' id='word_{line_id}_{j}' title='bbox {int(lx0 + j * step)} {ly0} "
+                            f"{int(lx0 + (j + 1) * step) - 1} {ly1}; x_wconf {90 + j % 10}'>{html.escape(word)}</span> ")
+            body.append('</span>')
+        body.append('</p></div>')
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en"><head><title></title>'
+            "<meta name='ocr-system' content='tesseract 5.3.0' /></head><body>"
+            f"<div class='ocr_page' id='page_1' title='image \"{image_name}\"; bbox 0 0 {config.width} {config.height}; "
+            "ppageno 0'>" + ''.join(body) + '</div></body></html>\n')
+
+
+def write_corpus(folder: Path, config: CorpusConfig) -> dict:
+    """
+    Writes the corpus
+
+    Layout:
+        <folder>/pagexml/page_<n>.png + page_<n>.xml    generate input
+        <folder>/hocr/page_<n>.hocr                     tesseract like output
+        <folder>/eval/page_<n>.gt.xml + page_<n>.xml    evaluation pairs
+
+    Args:
+        folder: output folder
+        config: corpus settings
+
+    Returns:
+        {'pages': number of pages, 'lines': number of lines}
+    """
+    for sub in ('pagexml', 'hocr', 'eval'):
+        folder.joinpath(sub).mkdir(parents=True, exist_ok=True)
+
+    lines = 0
+    for i in range(config.pages):
+        name = f'page_{i:04d}'
+        img, regions = synthetic_page(config, i)
+        cv2.imwrite(folder.joinpath('pagexml', name + '.png').as_posix(), img)
+        folder.joinpath('pagexml', name + '.xml').write_text(pagexml(name + '.png', config, regions), encoding='utf-8')
+        folder.joinpath('hocr', name + '.hocr').write_text(hocr(name + '.png', config, regions), encoding='utf-8')
+        folder.joinpath('eval', name + '.gt.xml').write_text(pagexml(name + '.png', config, regions), encoding='utf-8')
+        folder.joinpath('eval', name + '.xml').write_text(pagexml(name + '.png', config, regions, prediction=True),
+                                                          encoding='utf-8')
+        lines += sum(len(region_lines) for _, _, region_lines in regions)
+    return {'pages': config.pages, 'lines': lines}
+
+
+def config_from_args(args: dict) -> CorpusConfig:
+    return CorpusConfig(
+        pages=int(args.get('--pages')),
+        lines=int(args.get('--lines')),
+        points=max(int(args.get('--points')), 4),
+        width=int(args.get('--width')),
+        height=int(args.get('--height')),
+        seed=int(args.get('--seed')),
+    )
+
+
+def main() -> None:
+    args = docopt(__doc__)
+    counts = write_corpus(Path(args.get('<folder>')).absolute(), config_from_args(args))
+    print(f'Wrote {counts["pages"]} page(s) with {counts["lines"]} line(s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,20 @@
 import os
+import time
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 from docopt import docopt
 
-from tesspage.pagexml_parser import parse_pagexml
-from tesspage.pagexml_builder import build_xml_file
-from tesspage.hocr_parser import parse_hocr
-from tesspage.converter import xml_to_line_gt
-from tesspage.helper import abs_path, file_list, file_to_string
-from tesspage.eval import evaluate_cer, evaluate_wer
+from tesspage.helper import abs_path, file_list
+from tesspage.metrics import measured, metrics, stage
+from tesspage.shard import parse_shard, select_shard, shard_path
+
+# subcommand modules are imported by their functions, --help and light subcommands never load cv2, lxml or dinglehopper
+if TYPE_CHECKING:
+    from tesspage.converter import PipelineOptions
+
+
+EVAL_CACHE = '.tesspage_eval_cache.json'
 
 
 cli_doc = """TessPage Command Line Tool
@@ -18,17 +24,29 @@ Usage:
     tesspage.py (-h | --help)
     tesspage.py (-v | --version)
     tesspage.py setup
-    tesspage.py generate [--training_data <folder>] [--ground_truth <folder>]
-    tesspage.py training [--model_name <name>] [--start_model <model>] [--data_dir <folder>] [--ground_truth <folder>] [--tessdata <folder>] [--max_iterations <number>] [ARGS ...]
-    tesspage.py tesseract --model_name <name> [--input <path>] [--output <path>] [--data_dir <folder>] [--config_dir <config_dir>] [--config <config>] [ARGS ...]
-    tesspage.py eval [--eval_input <folder>]
+    tesspage.py generate [--training_data <folder>] [--ground_truth <folder>] [--jobs <number>] [--split_pages] [--force] [--archive <folder> [--shard_size <mb>]] [--prefetch <pages>] [--writers <number>] [--write_queue <lines>] [--grayscale] [--image_cache <mb>] [--normalize <height> [--binarize]] [--parser <backend>] [--shard <i/N>] [--metrics <file>] [--profile <file>]
+    tesspage.py unpack --archive <folder> [--ground_truth <folder>] [--pattern <pattern>]
+    tesspage.py dedup [--ground_truth <folder>] [--jobs <number>] [--distance <bits>] [--drop] [--report <file>]
+    tesspage.py training [--model_name <name>] [--start_model <model>] [--data_dir <folder>] [--ground_truth <folder>] [--tessdata <folder>] [--max_iterations <number>] [--jobs <number>] [--psm <number>] [--ratio_train <ratio>] [--no_prepare] [--patience <iterations>] [--min_delta <percent>] [--target_bcer <percent> --target_iteration <number>] [--training_log <file>] [ARGS ...]
+    tesspage.py tesseract --model_name <name> [--input <path>] [--output <path>] [--data_dir <folder>] [--config_dir <config_dir>] [--config <config>] [--jobs <number>] [--shard <i/N>] [--metrics <file>] [--profile <file>] [ARGS ...]
+    tesspage.py index [--training_data <folder>] [--database <file>] [--jobs <number>] [--parser <backend>]
+    tesspage.py query <text> [--database <file>] [--limit <number>] [--names]
+    tesspage.py stats [--database <file>] [--chars]
+    tesspage.py merge [--ground_truth <folder>] [--archive <folder>] [--eval_input <folder>] [--eval_output <file>] [--metrics <file>]
+    tesspage.py eval [--eval_input <folder>] [--jobs <number>] [--eval_output <file>] [--no_cache] [--lines [--worst <number>]] [--shard <i/N>] [--metrics <file>] [--profile <file>]
 
 Arguments:
     setup                           Download and setup tesspage, tesstrain and tesseract.
     generate                        Generate Ground-Truth from PageXML files.
+    unpack                          Write lines of a ground truth archive to line image and text files.
+    dedup                           Find (and drop) duplicate lines of the Ground-Truth.
     training                        Train Model.
     tesseract                       Run Tesseract.
     eval                            Evaluate quality of model. (Not implemented)
+    index                           Index PageXML documents (pages, regions, lines, texts) in a SQLite database.
+    query                           Find indexed lines containing <text>.
+    stats                           Show statistics of the indexed corpus.
+    merge                           Combine manifests, archive indexes, eval results and metrics of sharded runs.
     ARGS                            Additional arguments
 
 Options:
@@ -36,17 +54,53 @@ Options:
     -v --version                    Show version.
     --training_data <folder>        Input PageXML folder for training. [default: ./data/training_data/]
     --ground_truth <folder>         Ground Truth folder. [default: ./data/ground_truth/]
+    --jobs <number>                 Number of worker processes (generate, tesseract, eval), 0 uses all CPUs. [default: 0]
+    --split_pages                   Distribute single pages instead of documents to the workers.
+    --force                         Regenerate unchanged documents.
+    --archive <folder>              Ground Truth archive folder (tar shards + index).
+    --shard_size <mb>               Max size of a single archive shard in MB. [default: 1024]
+    --prefetch <pages>              Page images decoded ahead by a reader thread, 0 disables. [default: 2]
+    --writers <number>              Threads encoding and writing line images, 0 disables. [default: 4]
+    --write_queue <lines>           Max cropped lines waiting for a writer thread. [default: 64]
+    --grayscale                     Decode page images and write line images as grayscale.
+    --image_cache <mb>              Memory budget per worker in MB for page images requested again by the same document. [default: 1024]
+    --normalize <height>            Write grayscale, contrast normalized line images trimmed to the text and scaled to this height.
+    --binarize                      Write black and white line images, with --normalize.
+    --parser <backend>              PageXML parser: lxml (streaming) or bs4 (BeautifulSoup). [default: lxml]
+    --pattern <pattern>             Unpack only lines matching this pattern. [default: *]
+    --distance <bits>               Max differing bits (0-3) of the image hashes of duplicate lines with equal text. [default: 3]
+    --drop                          Delete duplicate lines, the first line in name order is kept.
+    --report <file>                 TSV file listing every duplicate line.
     --model_name <name>             Name of the model to be built. [default: foo]
     --start_model <model>           Name of the model to continue from. [default: eng]
     --data_dir <folder>             Data directory for output files, proto model, start model, etc. [default: ./tesstrain/data/]
     --tessdata <folder>             Path to the .traineddata directory to start finetuning from. [default: ./data/tessdata_best/]
     --max_iterations <number>       Max iterations. [default: 10000]
+    --psm <number>                  Page segmentation mode of the line images. [default: 13]
+    --ratio_train <ratio>           Share of lines used for training, the rest is used for evaluation. [default: 0.90]
+    --no_prepare                    Let make build .lstmf files and lists instead of preparing them with --jobs workers.
+    --patience <iterations>         Stop training if BCER did not improve for this many iterations, 0 disables. [default: 0]
+    --min_delta <percent>           BCER improvement (percentage points) that resets the patience. [default: 0.05]
+    --target_bcer <percent>         Stop training if BCER is above this value at --target_iteration.
+    --target_iteration <number>     Iteration of --target_bcer.
+    --training_log <file>           JSONL log of parsed training events, <data_dir>/<model_name>/training_log.jsonl if not set.
     --input <path>                  Input file/directory. [default: ./data/ocr_input/]
     --output <path>                 Output Directory [default: ./data/ocr_output/]
     --config_dir <config_dir>       Output config directory. [default: ./data/tessconfigs/configs/]
     --config <config>               Output config. [default: txt]
     --eval_input <folder>           Folder containing evaluation files [default: ./data/eval/]
+    --eval_output <file>            Write results to .json or .csv file.
+    --no_cache                      Do not reuse results of unchanged evaluation pairs.
+    --lines                         Align .xml/.hocr evaluation pairs line by line.
+    --worst <number>                Number of worst lines to report. [default: 10]
     --reference <file>              Supports .txt, .hocr .xml (pagexml) files [default: ./data/eval/reference.txt]
+    --database <file>               SQLite corpus index. [default: ./data/corpus.sqlite]
+    --limit <number>                Max number of lines, 0 for all. [default: 20]
+    --names                         Print line names only (e.g. to select training lines).
+    --chars                         Show the character inventory.
+    --metrics <file>                Write wall/CPU time and item counts per stage, slowest documents and peak memory to .json file.
+    --profile <file>                Run the main process under cProfile and write pstats to file (use --jobs 1 to include the workers).
+    --shard <i/N>                   Process only shard i (0 <= i < N) of N, picked by a hash of the relative file path.
     --prediction <file>             Supports .txt, .hocr .xml (pagexml) files [default: ./data/eval/prediction.txt]
     
 GitHub:
@@ -61,13 +115,82 @@ def cli() -> None:
     """ Parsing CLI input """
     args = docopt(cli_doc, help=True, version='tesspage v1.0', options_first=False)
 
+    profiler = None
+    if args.get('--profile'):
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.perf_counter()
+    shard = parse_shard(args.get('--shard')) if args.get('--shard') else None
+    try:
+        command(args, shard)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(abs_path(args.get('--profile')).as_posix())
+            print(f'Profile written to {args.get("--profile")}')
+        if args.get('--metrics') and not args.get('merge'):
+            target = shard_path(abs_path(args.get('--metrics')), shard)
+            metrics().export(
+                target,
+                command=next(name for name in ('generate', 'tesseract', 'eval') if args.get(name)),
+                jobs=int(args.get('--jobs')) or os.cpu_count(),
+                shard=args.get('--shard'),
+                wall_seconds=time.perf_counter() - start,
+            )
+            print(f'Metrics written to {target}')
+
+
+def command(args: dict, shard: tuple = None) -> None:
+    """
+    Runs the selected subcommand
+
+    Args:
+        args: docopt arguments
+        shard: (i, N) of a sharded run
+    """
     if args.get('setup'):
         setup()
 
     elif args.get('generate'):
+        from tesspage.converter import PipelineOptions
         generate_ground_truth(
             page_input_dir=abs_path(args.get('--training_data')),
             gt_output_dir=abs_path(args.get('--ground_truth')),
+            jobs=int(args.get('--jobs')) or os.cpu_count(),
+            split_pages=args.get('--split_pages'),
+            incremental=not args.get('--force'),
+            archive_dir=abs_path(args.get('--archive')) if args.get('--archive') else None,
+            shard_size=int(args.get('--shard_size')) << 20,
+            options=PipelineOptions(
+                prefetch=int(args.get('--prefetch')),
+                writers=int(args.get('--writers')),
+                write_queue=int(args.get('--write_queue')),
+                grayscale=args.get('--grayscale'),
+                cache_bytes=int(args.get('--image_cache')) << 20,
+                height=int(args.get('--normalize') or 0),
+                binarize=args.get('--binarize'),
+                parser=args.get('--parser'),
+            ),
+            shard=shard,
+        )
+
+    elif args.get('unpack'):
+        from tesspage.archive import unpack_archive
+        lines = unpack_archive(
+            archive_dir=abs_path(args.get('--archive')),
+            output_dir=abs_path(args.get('--ground_truth')),
+            pattern=args.get('--pattern'),
+        )
+        print(f'Unpacked {lines} line(s)')
+
+    elif args.get('dedup'):
+        dedup(
+            ground_truth_dir=abs_path(args.get('--ground_truth')),
+            jobs=int(args.get('--jobs')) or os.cpu_count(),
+            max_distance=int(args.get('--distance')),
+            drop=args.get('--drop'),
+            report_file=abs_path(args.get('--report')) if args.get('--report') else None,
         )
 
     elif args.get('training'):
@@ -78,7 +201,16 @@ def cli() -> None:
             ground_truth_dir=abs_path(args.get('--ground_truth')),
             tessdata=abs_path(args.get('--tessdata')),
             max_iterations=args.get('--max_iterations'),
-            args=" ".join(args.get('ARGS'))
+            args=" ".join(args.get('ARGS')),
+            jobs=int(args.get('--jobs')) or os.cpu_count(),
+            psm=int(args.get('--psm')),
+            ratio_train=float(args.get('--ratio_train')),
+            prepare=not args.get('--no_prepare'),
+            patience=int(args.get('--patience')),
+            min_delta=float(args.get('--min_delta')),
+            target_bcer=float(args.get('--target_bcer')) if args.get('--target_bcer') else None,
+            target_iteration=int(args.get('--target_iteration')) if args.get('--target_iteration') else 0,
+            log_file=abs_path(args.get('--training_log')) if args.get('--training_log') else None,
         )
 
     elif args.get('tesseract'):
@@ -89,12 +221,51 @@ def cli() -> None:
             data_dir=abs_path(args.get('--data_dir')),
             config_dir=abs_path(args.get('--config_dir')),
             config=args.get('--config'),
-            args=" ".join(args.get('ARGS'))
+            args=" ".join(args.get('ARGS')),
+            jobs=int(args.get('--jobs')) or os.cpu_count(),
+            shard=shard,
+        )
+
+    elif args.get('index'):
+        index(
+            input_dir=abs_path(args.get('--training_data')),
+            database=abs_path(args.get('--database')),
+            jobs=int(args.get('--jobs')) or os.cpu_count(),
+            backend=args.get('--parser'),
+        )
+
+    elif args.get('query'):
+        query(
+            text=args.get('<text>'),
+            database=abs_path(args.get('--database')),
+            limit=int(args.get('--limit')),
+            names=args.get('--names'),
+        )
+
+    elif args.get('stats'):
+        stats(
+            database=abs_path(args.get('--database')),
+            chars=args.get('--chars'),
+        )
+
+    elif args.get('merge'):
+        merge(
+            ground_truth_dir=abs_path(args.get('--ground_truth')),
+            archive_dir=abs_path(args.get('--archive')) if args.get('--archive') else None,
+            eval_folder=abs_path(args.get('--eval_input')),
+            eval_output=abs_path(args.get('--eval_output')) if args.get('--eval_output') else None,
+            metrics_file=abs_path(args.get('--metrics')) if args.get('--metrics') else None,
         )
 
     elif args.get('eval'):
         evaluate(
-            eval_folder=abs_path(args.get('--eval_input'))
+            eval_folder=abs_path(args.get('--eval_input')),
+            jobs=int(args.get('--jobs')) or os.cpu_count(),
+            eval_output=abs_path(args.get('--eval_output')) if args.get('--eval_output') else None,
+            use_cache=not args.get('--no_cache'),
+            line_level=args.get('--lines'),
+            worst=int(args.get('--worst')),
+            shard=shard,
         )
 
     else:
@@ -144,25 +315,145 @@ def setup() -> None:
         print('run: sudo apt install -y tesseract-ocr libtesseract-dev libtool pkg-config make wget bash unzip bc')
 
 
-def generate_ground_truth(page_input_dir: Path, gt_output_dir: Path) -> None:
+def generate_ground_truth(page_input_dir: Path, gt_output_dir: Path, jobs: int = 1, split_pages: bool = False, incremental: bool = True, archive_dir: Path = None, shard_size: int = 1 << 30, options: 'PipelineOptions' = None, shard: tuple = None) -> None:
     """
     Logic for parsing a set of image + pagexml files to line-image + text files
 
     Args:
         page_input_dir: folder containing image + pagexml pairs
         gt_output_dir: output folder
+        jobs: number of worker processes
+        split_pages: distribute single pages instead of whole documents to the workers
+        incremental: skip documents that are unchanged since the last run (manifest in gt_output_dir)
+        archive_dir: pack lines into tar shards in this folder instead of writing files to gt_output_dir
+        shard_size: max shard size in bytes
+        options: per document pipeline (page prefetch, writer threads, queue depths)
+        shard: (i, N), process only documents of shard i, manifest and archive index are written per shard
     """
+    from concurrent.futures import ProcessPoolExecutor
+    from tesspage.archive import ShardWriter
+    from tesspage.converter import PipelineOptions, line_gt_summary
+    from tesspage.manifest import GTManifest
+
     if not page_input_dir.exists():
         raise Exception('Input directory does not exist!')
 
-    for file in file_list(page_input_dir, 'xml'):
-        print(f'{file.name}:')
-        xml = parse_pagexml(file)  # parse files to document object
-        print(f'\t{xml_to_line_gt(xml, gt_output_dir)}')  # generate line image and text files from document object
+    files = file_list(page_input_dir, 'xml')
+    shard_files = select_shard(files, page_input_dir, shard)
+    if shard is not None:
+        print(f'Shard {shard[0]}/{shard[1]}: {len(shard_files)} of {len(files)} document(s)')
+    writer = ShardWriter(archive_dir, shard_size, shard=shard) if archive_dir is not None else None
+    if writer is None:
+        os.makedirs(gt_output_dir.as_posix(), exist_ok=True)
+    output_options = (options or PipelineOptions()).output_options()
+    manifest = GTManifest(gt_output_dir, shard, output_options) if incremental and writer is None else None  # shards are always rewritten
+    if manifest is not None:
+        removed = manifest.prune(files)
+        manifest.keep(shard_files)  # documents of other shards are recorded by their own manifests
+        todo = [file for file in shard_files if not manifest.unchanged(file)]
+        print(f'{len(shard_files) - len(todo)} unchanged document(s) skipped, {removed} line(s) of removed documents deleted')
+    else:
+        todo = shard_files
+
+    pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        for file, (counts, lines, images, log) in _generate_results(pool, todo, gt_output_dir, jobs, split_pages, writer is not None, options):
+            print(f'{file.name}:')
+            print(log, end='')
+            print(f'\t{line_gt_summary(*counts)}')
+            if writer is not None:
+                with stage('archive', items=len(lines)):
+                    for record in lines:
+                        writer.write(*record)
+            if manifest is not None:
+                removed = manifest.update(file, images, lines)
+                if removed:
+                    print(f'\tRemoved {removed} outdated line(s)')
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if manifest is not None:
+            manifest.save()
+        if writer is not None:
+            writer.close()
+            print(f'Packed {writer.line_counter} line(s) into {writer.shard_counter} shard(s)')
+    print('Done!')
+
+
+def _generate_results(pool, files: list, gt_output_dir: Path, jobs: int, split_pages: bool, pack: bool, options: 'PipelineOptions'):
+    """
+    Runs line_gt_worker for every document (or page) in input order
+
+    Args:
+        pool: process pool, None for serial execution
+        files: PageXML files
+        gt_output_dir: output folder
+        jobs: number of worker processes
+        split_pages: distribute single pages instead of whole documents to the workers
+        pack: return encoded lines instead of writing files
+        options: per document pipeline options
+
+    Returns:
+        generator of (file, (counts, written lines or records, page images, console output))
+    """
+    import io
+    from contextlib import redirect_stdout
+    from dataclasses import replace
+    from functools import partial
+    from tesspage.converter import PipelineOptions, line_gt_worker
+    from tesspage.helper import ordered_imap
+    from tesspage.pagexml_parser import parse_pagexml
+
+    def run(tasks):
+        if pool is None:
+            return ((task, measured(line_gt_worker, task)) for task in tasks)
+        return ordered_imap(pool, partial(measured, line_gt_worker), tasks, depth=2 * jobs)
+
+    if not split_pages:
+        for (file, _, _, _), (result, snapshot) in run((file, gt_output_dir, pack, options) for file in files):
+            metrics().merge(snapshot, document=file.name, items=result[0][0])
+            yield file, result
+        return
+
+    for file in files:
+        log = io.StringIO()
+        start = time.perf_counter()
+        with redirect_stdout(log), stage('parse'):
+            xml = parse_pagexml(file, (options or PipelineOptions()).parser)  # pages of one document are processed in parallel
+        total, lines, images = [0, 0, 0], [], []
+        for _, ((counts, page_lines, page_images, page_log), snapshot) in run((replace(xml, pages=[page]), gt_output_dir, pack, options) for page in xml.pages):
+            metrics().merge(snapshot)
+            total = [t + c for t, c in zip(total, counts)]
+            lines += page_lines
+            images += page_images
+            log.write(page_log)
+        metrics().document(file.name, time.perf_counter() - start, total[0])
+        yield file, (tuple(total), lines, images, log.getvalue())
+
+
+def dedup(ground_truth_dir: Path, jobs: int = 1, max_distance: int = 3, drop: bool = False, report_file: Path = None) -> None:
+    """
+    Finds duplicate lines (equal text, similar image) in the Ground-Truth folder
+
+    Args:
+        ground_truth_dir: Ground Truth folder
+        jobs: number of hashing workers
+        max_distance: max differing bits of the image hashes
+        drop: delete duplicate lines
+        report_file: optional TSV file listing every duplicate line
+    """
+    from tesspage.dedup import deduplicate
+
+    print('Searching duplicates...')
+    lines, duplicates, size = deduplicate(ground_truth_dir, jobs, max_distance, drop, report_file)
+    print(f'\t{duplicates} duplicate(s) of {lines} line(s), {size / (1 << 20):.1f} MB')
+    if report_file is not None:
+        print(f'\tReport: {report_file}')
+    print(f'\tDropped {duplicates} line(s)' if drop else '\tUse --drop to delete them')
     print('Done!')
 
 
-def training(model_name: str, start_model: str, data_dir: Path, ground_truth_dir: Path, tessdata: Path, max_iterations: str, args: str) -> None:
+def training(model_name: str, start_model: str, data_dir: Path, ground_truth_dir: Path, tessdata: Path, max_iterations: str, args: str, jobs: int = 1, psm: int = 13, ratio_train: float = 0.9, prepare: bool = True, patience: int = 0, min_delta: float = 0.05, target_bcer: float = None, target_iteration: int = 0, log_file: Path = None) -> None:
     """
     Start Tesseract training
 
@@ -174,132 +465,272 @@ def training(model_name: str, start_model: str, data_dir: Path, ground_truth_dir
         tessdata: Path to the .traineddata directory to start finetuning from
         max_iterations: training iterations
         args: custom args for training
+        jobs: number of workers preparing .lstmf files
+        psm: page segmentation mode of the line images
+        ratio_train: share of lines used for training
+        prepare: build .lstmf files and list files before make, so make starts with the training
+        patience: stop if BCER did not improve by min_delta for this many iterations, 0 disables
+        min_delta: BCER improvement in percentage points
+        target_bcer: stop if BCER is above this value at target_iteration
+        target_iteration: iteration of target_bcer
+        log_file: JSONL log of training events, default <data_dir>/<model_name>/training_log.jsonl
     """
+    from tesspage.training import EarlyStopping, run_training
+
+    output_dir = data_dir.joinpath(model_name)
+    if prepare:
+        from tesspage.training import prepare_training
+        if not prepare_training(ground_truth_dir, output_dir, jobs, psm, ratio_train):
+            return
+
     os.chdir('./tesstrain')
-    cmd = f'make training MODEL_NAME={model_name} START_MODEL={start_model} DATA_DIR={data_dir} GROUND_TRUTH_DIR={ground_truth_dir} TESSDATA={tessdata} MAX_ITERATIONS={max_iterations} {args}'
-    os.system(cmd)
+    cmd = f'make training MODEL_NAME={model_name} START_MODEL={start_model} DATA_DIR={data_dir} GROUND_TRUTH_DIR={ground_truth_dir} TESSDATA={tessdata} MAX_ITERATIONS={max_iterations} PSM={psm} RATIO_TRAIN={ratio_train} {args}'
+    log_file = log_file or output_dir.joinpath('training_log.jsonl')
+    returncode, reason = run_training(cmd, log_file, EarlyStopping(patience, min_delta, target_bcer, target_iteration))
+    if reason is None:
+        print('Done!' if returncode == 0 else f'Training failed ({returncode})')
+        return
+
+    print(f'Early stopping: {reason}')
+    if output_dir.joinpath('checkpoints', f'{model_name}_checkpoint').exists():
+        print('Writing model from last checkpoint')
+        run_training(cmd, log_file)  # checkpoint is up to date, make only converts it to traineddata
+    print('Done!')
 
 
-def tesseract(model_name: str, input_dir: Path, output_dir: Path, data_dir: Path, config_dir: Path, config: str, args: str) -> None:
+def tesseract(model_name: str, input_dir: Path, output_dir: Path, data_dir: Path, config_dir: Path, config: str, args: str, jobs: int = 1, shard: tuple = None) -> None:
     """
     Start Tesseract OCR
     Args:
         model_name: Name of model to be used
-        input_dir: folder containing images
+        input_dir: image file or folder containing images
         output_dir: folder for file output
         data_dir: Data directory for output files, proto model, start model, etc.
         config_dir: Output config directory
         config: output format
         args: custom args for ocr
+        jobs: number of tesseract workers
+        shard: (i, N), process only images of shard i
     """
-    cfg = config_dir.joinpath(config)  # config path
+    from tesspage.ocr import TesseractPool, cli_fallback
 
-    # single file
     if input_dir.is_file():
-
-        # custom pagexml config
-        if config.lower() == 'pagexml':
-            temp_folder = output_dir.joinpath('temp')  # create temp folder
-            if not temp_folder.exists():
-                os.mkdir(temp_folder.as_posix())
-            page_tesseract(input_dir, output_dir, temp_folder, data_dir, model_name, config_dir, args)  # run tesseract on file
-
-        # default configs
-        else:
-            output = output_dir.joinpath(os.path.splitext(input_dir.name)[0])  # output base: output_dir + filename
-            run_tesseract(input_dir, output, data_dir, model_name, cfg, args)  # run tesseract
-        print('Done!')
-
-    # directory
+        images = select_shard([input_dir], input_dir.parent, shard)
     elif input_dir.is_dir():
-        images = file_list(input_dir, '*')
-        if config.lower() == 'pagexml':
-            temp_folder = output_dir.joinpath('temp')  # create temp folder
-            if not temp_folder.exists():
-                os.mkdir(temp_folder.as_posix())
+        images = select_shard(file_list(input_dir, '*'), input_dir, shard)
+    else:
+        print('Input not found')
+        return
+
+    reason = cli_fallback(config, args)
+    if reason is not None:
+        print(f'Warning: {reason}, every image starts a tesseract process that loads the model again')
+    failed = 0
+    with TesseractPool(data_dir, model_name, config_dir, config, args, jobs) as pool:
+        for image, error in pool.run(images, output_dir):
+            print(f'{image}:')
+            if error is not None:
+                print(f'\tFailed: {error}')
+                failed += 1
+    if failed:
+        print(f'{failed} of {len(images)} image(s) failed')
+    print('Done!')
 
-            for image in images:
-                print(f'{image}:')
-                page_tesseract(image, output_dir, temp_folder, data_dir, model_name, config_dir, args)  # run tesseract on every file
 
+def evaluate(eval_folder: Path, jobs: int = 1, eval_output: Path = None, use_cache: bool = True, line_level: bool = False, worst: int = 10, shard: tuple = None) -> None:
+    """
+    Evaluate model precision, prints result
+
+    Args:
+        eval_folder: folder containing eval files, pred with .extension, gt with .gt.extension. Supports .txt, .hocr and .xml (page)
+        jobs: number of worker processes
+        eval_output: optional .json or .csv file for machine-readable results
+        use_cache: reuse results of unchanged file pairs (cache file in eval_folder)
+        line_level: align .xml/.hocr pairs line by line
+        worst: number of worst lines to print in line-level mode
+        shard: (i, N), evaluate only pairs of shard i, cache and eval_output are written per shard
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+    from tesspage.eval import EvalCache, eval_summary, eval_worker, prediction_file, write_eval_summary
+    from tesspage.helper import file_hash, ordered_imap
+
+    cache = EvalCache(shard_path(eval_folder.joinpath(EVAL_CACHE), shard)) if use_cache and eval_folder.is_dir() else None
+
+    rows = []  # result row per reference file, in file order
+    tasks = []  # (reference, prediction) pairs not found in cache
+    for ref_path in select_shard(file_list(eval_folder, 'gt.*'), eval_folder, shard):
+        pred_path = prediction_file(ref_path)
+        row = {'reference': ref_path.name, 'prediction': pred_path.name, 'status': 'ok', 'error': ''}
+        rows.append(row)
+        if not pred_path.is_file():
+            row['status'] = 'missing'
+            continue
+        row['key'] = f'{file_hash(ref_path)}:{file_hash(pred_path)}' + (':lines' if line_level else '')
+        cached = cache.get(row['key']) if cache is not None else None
+        if cached is not None:
+            row.update(cached)
         else:
-            for image in images:
-                print(f'{image}:')
-                output = output_dir.joinpath(os.path.splitext(image.name)[0])  # output base: output_dir + filename
-                run_tesseract(image, output, data_dir, model_name, cfg, args)  # run tesseract
-        print('Done!')
+            tasks.append((ref_path, pred_path, line_level))
 
+    results = {}
+    if jobs <= 1 or len(tasks) <= 1:
+        measured_results = ((task, measured(eval_worker, task)) for task in tasks)
     else:
-        print('Input not found')
+        pool = ProcessPoolExecutor(max_workers=jobs)
+        measured_results = ordered_imap(pool, partial(measured, eval_worker), tasks, depth=4 * jobs)
+    for task, (result, snapshot) in measured_results:
+        metrics().merge(snapshot, document=task[0].name, items=1)
+        results[task] = result
+    if jobs > 1 and len(tasks) > 1:
+        pool.shutdown()
+
+    for row in rows:
+        if row['status'] == 'missing':
+            print(f'{row["reference"]}/No matching file found')
+            continue
+        task = (eval_folder.joinpath(row['reference']), eval_folder.joinpath(row['prediction']), line_level)
+        if task in results:
+            result, error = results[task]
+            if error is not None:
+                row.update(status='error', error=error)
+                print(f'{row["reference"]}/{row["prediction"]}: {error}')
+                continue
+            row.update(result)
+            if cache is not None:
+                cache.set(row['key'], result)
+        cer, wer = float(row['cer']), float(row['wer'])
+        print('{0}/{1}: CER {2:.4f}%, WER: {3:.4}%'.format(row['reference'], row['prediction'], cer * 100, wer * 100))
+        for line in row.get('lines', []):
+            print('\t{0}/{1}: CER {2:.4f}%, WER: {3:.4}%'.format(line['reference_id'], line['prediction_id'], line['cer'] * 100, line['wer'] * 100))
+
+    if cache is not None and results:
+        cache.save()
+
+    summary = eval_summary(rows)
+    if summary['evaluated'] == 0:
+        print('Summary:\nNo values!')
+    else:
+        print('\nSummary:\nCER {0:.4f}%\nWER {1:.4f}%'.format(summary['cer'] * 100, summary['wer'] * 100))
+
+    worst_lines = sorted(((line, row['reference']) for row in rows for line in row.get('lines', []) if line['distance']),
+                         key=lambda x: (-x[0]['distance'], -x[0]['cer']))[:worst]
+    if worst_lines:
+        print('\nWorst lines:')
+        for line, reference in worst_lines:
+            print(f'{reference}/{line["reference_id"]}: {line["distance"]} error(s), CER {line["cer"] * 100:.4f}%')
+            print(f'\tGT:   {line["reference"]}\n\tPRED: {line["prediction"]}')
+
+    if eval_output is not None:
+        write_eval_summary([{k: v for k, v in row.items() if k != 'key'} for row in rows], summary,
+                           shard_path(eval_output, shard))
 
 
-def run_tesseract(input_dir: Path, output_base: Path, data_dir: Path, model_name: str, cfg: Path, args: str) -> None:
+def merge(ground_truth_dir: Path, archive_dir: Path = None, eval_folder: Path = None, eval_output: Path = None,
+          metrics_file: Path = None) -> None:
     """
-    Run Tesseract CLI with given arguments
+    Combines the per shard outputs of the latest sharded run (--shard i/N of all N shards).
+    Shard files are kept, so a single failed shard can be rerun and merged again.
 
     Args:
-        input_dir: folder containing images
-        output_base: output_dir + filename without extension
-        data_dir: Data directory for output files, proto model, start model, etc.
-        model_name: Name of model to be used
-        cfg: config_dir + config
-        args: custom args for ocr
+        ground_truth_dir: folder with generate manifests
+        archive_dir: folder with archive indexes
+        eval_folder: folder with eval caches
+        eval_output: eval results file as given to eval
+        metrics_file: metrics file as given to generate, tesseract or eval
     """
-    cmd = f'tesseract {input_dir} {output_base} --tessdata-dir {data_dir} -l {model_name} {cfg} {args}'
-    os.system(cmd)  # create file <output_base>.<config>
+    from tesspage.archive import INDEX_FILE, merge_indexes
+    from tesspage.eval import merge_eval_caches, merge_eval_summaries
+    from tesspage.manifest import GTManifest, merge_manifests
+    from tesspage.metrics import merge_metrics
+
+    steps = [(ground_truth_dir.joinpath(GTManifest.FILE), merge_manifests, ground_truth_dir, 'document(s)')]
+    if archive_dir is not None:
+        steps.append((archive_dir.joinpath(INDEX_FILE), merge_indexes, archive_dir, 'line(s)'))
+    if eval_folder is not None:
+        steps.append((eval_folder.joinpath(EVAL_CACHE), merge_eval_caches, eval_folder.joinpath(EVAL_CACHE), 'pair(s)'))
+    if eval_output is not None:
+        steps.append((eval_output, lambda x: (merge_eval_summaries(x) or {}).get('pairs'), eval_output, 'pair(s)'))
+    if metrics_file is not None:
+        steps.append((metrics_file, merge_metrics, metrics_file, 'shard(s)'))
+
+    for target, merge_fn, arg, unit in steps:
+        print(f'{target}:')
+        merged = merge_fn(arg)
+        print('\tNothing merged' if merged is None else f'\tMerged {merged} {unit}')
+    print('Done!')
 
 
-def page_tesseract(input_dir: Path, output_dir: Path, temp_folder: Path, data_dir: Path, model_name: str, config_dir: Path, args: str) -> None:
+def index(input_dir: Path, database: Path, jobs: int = 1, backend: str = 'lxml') -> None:
     """
-    Run Tesseract and parse to pagexml
+    Adds new and changed PageXML files to the corpus index, removed files are dropped
 
     Args:
-        input_dir: folder containing images
-        output_dir: folder for file output
-        temp_folder: folder for temp hocr files
-        data_dir: Data directory for output files, proto model, start model, etc.
-        model_name: Name of model to be used
-        config_dir: Output config directory
-        args: custom args for ocr
+        input_dir: PageXML folder
+        database: SQLite corpus index
+        jobs: number of parser workers
+        backend: PageXML parser backend
     """
-    temp_base = temp_folder.joinpath(os.path.splitext(input_dir.name)[0])  # temp base in temp folder
-    hocr_cfg = config_dir.joinpath('hocr')  # set tesseract config to hocr
-    run_tesseract(input_dir, temp_base, data_dir, model_name, hocr_cfg, args)  # run tesseract on file
+    from tesspage.corpus_index import CorpusIndex
+
+    print('Indexing...')
+    os.makedirs(database.parent.as_posix(), exist_ok=True)
+    start = time.perf_counter()
+    with CorpusIndex(database) as corpus:
+        indexed, unchanged, removed = corpus.update(input_dir, jobs, backend)
+    print(f'\t{indexed} document(s) indexed, {unchanged} unchanged, {removed} removed '
+          f'({time.perf_counter() - start:.2f}s)')
+    print('Done!')
 
-    hocr_file = parse_hocr(Path(temp_base.as_posix() + '.hocr'))  # read hocr file in temp folder
-    output = output_dir.joinpath(os.path.splitext(input_dir.name)[0] + '.xml')  # create base for main output folder
-    build_xml_file(data=hocr_file, target_file=output)  # write pagexml file to main output folder
 
-    os.system(f'rm {temp_base}.hocr')  # remove temp file
+def query(text: str, database: Path, limit: int = 20, names: bool = False) -> None:
+    """
+    Prints indexed lines containing text
+
+    Args:
+        text: searched text (case sensitive)
+        database: SQLite corpus index
+        limit: max number of lines, 0 for all
+        names: print line names only
+    """
+    from tesspage.corpus_index import CorpusIndex
+
+    if not database.exists():
+        print(f'No corpus index: {database}, run index first')
+        return
+    with CorpusIndex(database) as corpus:
+        for name, file, line in corpus.query(text, limit):
+            print(name if names else f'{name}\t{os.path.basename(file)}\t{line}')
 
 
-def evaluate(eval_folder: Path) -> None:
+def stats(database: Path, chars: bool = False) -> None:
     """
-    Evaluate model precision, prints result
+    Prints statistics of the corpus index
 
     Args:
-        eval_folder: folder containing eval files, pred with .extension, gt with .gt.extension. Supports .txt, .hocr and .xml (page)
+        database: SQLite corpus index
+        chars: print the character inventory
     """
-    cer_list = []
-    wer_list = []
-
-    ref_files: list[Path] = file_list(eval_folder, 'gt.*')
-    for ref_path in ref_files:
-        try:
-            pred_path = ref_path.parent.joinpath('.'.join(ref_path.name.split('.')[0:-2]) + ref_path.suffix)
-            ref = file_to_string(ref_path)
-            pred = file_to_string(pred_path)
-            cer = float(evaluate_cer(ref, pred))
-            cer_list.append(cer)
-            wer = float(evaluate_wer(ref, pred))
-            wer_list.append(wer)
-            print('{0}/{1}: CER {2:.4f}%, WER: {3:.4}%'.format(ref_path.name, pred_path.name, cer * 100, wer * 100))
-        except Exception:
-            print(f'{ref_path.name}/No matching file found')
-    if len(cer_list) == 0 or len(wer_list) == 0:
-        print('Summary:\nNo values!')
-    else:
-        print('\nSummary:\nCER {0:.4f}%\nWER {1:.4f}%'.format((sum(cer_list) / len(cer_list)) * 100, (sum(wer_list) / len(wer_list)) * 100))
+    from tesspage.corpus_index import CorpusIndex
+
+    if not database.exists():
+        print(f'No corpus index: {database}, run index first')
+        return
+    with CorpusIndex(database) as corpus:
+        s = corpus.stats()
+        print(f'{s["documents"]} document(s), {s["pages"]} page(s), {s["regions"]} region(s), {s["lines"]} line(s)')
+        print(f'{s["characters"]} character(s), {s["distinct_characters"]} distinct')
+        if s['length']:
+            print('Line length: ' + ', '.join(f'{k} {v}' for k, v in s['length'].items()))
+            for start, count in s['histogram']:
+                print(f'\t{start:>4}-{start + 9:<4} {count:>8}')
+        print('Sources:')
+        for source, documents, pages, lines in s['sources']:
+            print(f'\t{source}: {documents} document(s), {pages} page(s), {lines} line(s)')
+        if chars:
+            print('Characters:')
+            for char, count, documents in corpus.chars():
+                print(f'\t{char!r:>8} U+{ord(char):04X} {count:>10} in {documents} document(s)')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,221 @@
+import fnmatch
+import io
+import os
+import re
+import tarfile
+from pathlib import Path
+
+from tesspage.shard import complete_parts, shard_path
+
+
+INDEX_FILE = 'index.tsv'
+INDEX_HEADER = 'name\tshard\tpng_offset\tpng_size\ttxt_offset\ttxt_size\n'
+
+
+class ShardWriter:
+    def __init__(self, archive_dir: Path, max_bytes: int = 1 << 30, prefix: str = 'gt', shard: tuple = None):
+        """
+        Packs line images and texts into size bounded tar shards with an offset index
+
+        Args:
+            archive_dir: output folder for shards and index
+            max_bytes: max size of a single shard
+            prefix: shard file name prefix (<prefix>-000000.tar)
+            shard: (i, N) of a sharded run, tar files and index are written per shard and combined by merge_indexes,
+                tar files and index of a previous run with the same prefix and shard are replaced
+        """
+        self.archive_dir = archive_dir
+        self.max_bytes = max_bytes
+        self.prefix = shard_path(Path(prefix), shard).as_posix()
+        self.shard_counter = 0
+        self.line_counter = 0
+        self.__tar = None
+        self.__shard = None
+        os.makedirs(archive_dir.as_posix(), exist_ok=True)
+        self.__remove_shards()
+        self.__index = open(shard_path(archive_dir.joinpath(INDEX_FILE), shard).as_posix(), 'w', encoding='utf-8')
+        self.__index.write(INDEX_HEADER)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __remove_shards(self) -> None:
+        """
+        Deletes tar files of a previous run with this prefix and shard, a smaller rerun would leave them behind
+        """
+        prefix = self.archive_dir.joinpath(self.prefix)
+        pattern = re.compile(rf'{re.escape(prefix.name)}-\d{{6}}\.tar')
+        for file in prefix.parent.glob(f'{prefix.name}-*.tar'):
+            if pattern.fullmatch(file.name):
+                file.unlink()
+
+    def __next_shard(self) -> None:
+        if self.__tar is not None:
+            self.__tar.close()
+        self.__shard = f'{self.prefix}-{self.shard_counter:06d}.tar'
+        self.__tar = tarfile.open(self.archive_dir.joinpath(self.__shard).as_posix(), 'w', format=tarfile.GNU_FORMAT)
+        self.shard_counter += 1
+
+    def __add(self, name: str, data: bytes) -> int:
+        """
+        Adds a member to the current shard
+
+        Returns:
+            offset of member data within the shard
+        """
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        offset = self.__tar.offset + len(info.tobuf(self.__tar.format, self.__tar.encoding, self.__tar.errors))
+        self.__tar.addfile(info, io.BytesIO(data))
+        return offset
+
+    def write(self, name: str, png: bytes, text: str) -> None:
+        """
+        Adds one line to the archive
+
+        Args:
+            name: line base name
+            png: encoded line image
+            text: line text
+        """
+        txt = text.encode('utf-8')
+        if self.__tar is None or (self.__tar.offset + len(png) + len(txt) + 2048 > self.max_bytes
+                                  and self.__tar.offset > 0):
+            self.__next_shard()
+        png_offset = self.__add(name + '.png', png)
+        txt_offset = self.__add(name + '.gt.txt', txt)
+        self.__index.write(f'{name}\t{self.__shard}\t{png_offset}\t{len(png)}\t{txt_offset}\t{len(txt)}\n')
+        self.line_counter += 1
+
+    def close(self) -> None:
+        if self.__tar is not None:
+            self.__tar.close()
+            self.__tar = None
+        self.__index.close()
+
+
+class ShardReader:
+    def __init__(self, archive_dir: Path):
+        """
+        Random and sequential access to lines packed by ShardWriter
+
+        Args:
+            archive_dir: folder containing shards and index
+        """
+        self.archive_dir = archive_dir
+        self.index = {}  # name -> (shard, png offset, png size, txt offset, txt size)
+        with open(archive_dir.joinpath(INDEX_FILE).as_posix(), 'r', encoding='utf-8') as f:
+            next(f)  # header
+            for row in f:
+                name, shard, *offsets = row.rstrip('\n').split('\t')
+                self.index[name] = (shard, *(int(x) for x in offsets))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def names(self, pattern: str = '*') -> list:
+        """
+        Line names in archive order
+
+        Args:
+            pattern: fnmatch pattern
+
+        Returns:
+            list of line base names
+        """
+        return [name for name in self.index if fnmatch.fnmatchcase(name, pattern)]
+
+    def read(self, name: str) -> tuple:
+        """
+        Reads a single line
+
+        Args:
+            name: line base name
+
+        Returns:
+            (png bytes, text)
+        """
+        shard, png_offset, png_size, txt_offset, txt_size = self.index[name]
+        with open(self.archive_dir.joinpath(shard).as_posix(), 'rb') as f:
+            return self.__read(f, png_offset, png_size), self.__read(f, txt_offset, txt_size).decode('utf-8')
+
+    def stream(self, pattern: str = '*'):
+        """
+        Reads lines shard by shard, every shard is opened once
+
+        Args:
+            pattern: fnmatch pattern
+
+        Returns:
+            generator of (name, png bytes, text)
+        """
+        f, current = None, None
+        try:
+            for name in self.names(pattern):
+                shard, png_offset, png_size, txt_offset, txt_size = self.index[name]
+                if shard != current:
+                    if f is not None:
+                        f.close()
+                    f, current = open(self.archive_dir.joinpath(shard).as_posix(), 'rb'), shard
+                yield name, self.__read(f, png_offset, png_size), self.__read(f, txt_offset, txt_size).decode('utf-8')
+        finally:
+            if f is not None:
+                f.close()
+
+    @staticmethod
+    def __read(f, offset: int, size: int) -> bytes:
+        f.seek(offset)
+        return f.read(size)
+
+
+def merge_indexes(archive_dir: Path):
+    """
+    Combines the indexes of all shards of the latest sharded run into the archive index
+
+    Args:
+        archive_dir: folder containing shards and indexes
+
+    Returns:
+        number of lines, None if there is no complete set of shard indexes
+    """
+    parts = complete_parts(archive_dir.joinpath(INDEX_FILE))
+    if not parts:
+        return None
+    lines = 0
+    temp = archive_dir.joinpath(INDEX_FILE + '.tmp')
+    with open(temp.as_posix(), 'w', encoding='utf-8') as out:
+        out.write(INDEX_HEADER)
+        for part in parts:
+            with open(part.as_posix(), 'r', encoding='utf-8') as f:
+                next(f)  # header
+                for row in f:
+                    out.write(row)
+                    lines += 1
+    os.replace(temp.as_posix(), archive_dir.joinpath(INDEX_FILE).as_posix())
+    return lines
+
+
+def unpack_archive(archive_dir: Path, output_dir: Path, pattern: str = '*') -> int:
+    """
+    Materializes archived lines as .png and .gt.txt files
+
+    Args:
+        archive_dir: folder containing shards and index
+        output_dir: ground truth folder
+        pattern: fnmatch pattern of line names
+
+    Returns:
+        number of written lines
+    """
+    os.makedirs(output_dir.as_posix(), exist_ok=True)
+    counter = 0
+    for name, png, text in ShardReader(archive_dir).stream(pattern):
+        with open(output_dir.joinpath(name + '.png').as_posix(), 'wb') as f:
+            f.write(png)
+        with open(output_dir.joinpath(name + '.gt.txt').as_posix(), 'w', encoding='utf-8') as f:
+            f.write(text)
+        counter += 1
+    return counter
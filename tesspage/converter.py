@@ -1,10 +1,63 @@
+import io
 import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional
 
 import cv2
 import numpy
 
 from tesspage.document import Document
+from tesspage.image import ImageCache, LineNormalizer, image_cache
+from tesspage.metrics import stage
+from tesspage.pagexml_parser import parse_pagexml, parser_backend
+
+
+class LineCropper:
+    def __init__(self, img: numpy.ndarray):
+        self.img = img
+        self.__buffer = numpy.empty(0, dtype=img.dtype)
+
+    def crop(self, coords) -> Optional[numpy.ndarray]:
+        """
+        Crops a single line polygon from the page image, pixels outside the polygon are white.
+        Only the bounding rectangle of the line is touched, the result is written into a buffer that is reused
+        for every line of the page.
+
+        Args:
+            coords: line polygon, int32 array of shape (n, 2) or nested list [[x0, y0],...]
+
+        Returns:
+            cropped line image (view into the shared buffer, valid until next call), None if line is outside the image
+        """
+        points = numpy.asarray(coords, dtype=numpy.int32).reshape(-1, 2)
+        x, y, w, h = cv2.boundingRect(points)
+
+        # clip bounding rectangle to image
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, self.img.shape[1]), min(y + h, self.img.shape[0])
+        if x1 <= x0 or y1 <= y0:
+            return None
+        w, h = x1 - x0, y1 - y0
+
+        mask = numpy.zeros((h, w), dtype=numpy.uint8)
+        cv2.fillPoly(mask, [points - numpy.array((x0, y0), dtype=numpy.int32)], 1)  # polygon relative to clipped rectangle
+        mask = mask.view(bool)
+
+        roi = self.img[y0:y1, x0:x1]
+        shape = (h, w) + self.img.shape[2:]
+        size = int(numpy.prod(shape))
+        if self.__buffer.size < size:
+            self.__buffer = numpy.empty(size, dtype=self.img.dtype)
+        out = self.__buffer[:size].reshape(shape)  # contiguous view
+
+        out.fill(255)
+        numpy.copyto(out, roi, where=mask if roi.ndim == 2 else mask[..., None])
+        return out
 
 
 def xml_to_line_gt(xml: Document, output_dir: Path) -> str:
@@ -15,34 +68,212 @@ def xml_to_line_gt(xml: Document, output_dir: Path) -> str:
     :param output_dir: where ground truth data will be stored
     :return: status string
     """
+    return line_gt_summary(*crop_document(xml, output_dir))
+
+
+@dataclass()
+class PipelineOptions:
+    prefetch: int = 2  # decoded pages read ahead, 0 reads in the crop thread
+    writers: int = 4  # threads encoding and writing lines, 0 writes in the crop thread
+    write_queue: int = 64  # max cropped lines waiting for a writer
+    grayscale: bool = False  # decode single channel page images
+    cache_bytes: int = 1 << 30  # byte budget for pages requested again within a document
+    height: int = 0  # normalized line height (grayscale, contrast, trimmed), 0 writes crops at scan resolution
+    binarize: bool = False  # black and white normalized lines
+    parser: str = 'lxml'  # PageXML parser backend, see pagexml_parser.PARSER_BACKENDS
+
+    def __post_init__(self):
+        parser_backend(self.parser)  # fail before any document is processed
 
-    if not output_dir.exists():
-        os.mkdir(output_dir.as_posix())
+    def output_options(self) -> dict:
+        """
+        Options that change the written lines, recorded in the generate manifest
+        """
+        return {'grayscale': self.grayscale, 'height': self.height, 'binarize': self.binarize, 'parser': self.parser}
+
+
+class PageReader:
+    def __init__(self, pages: list, depth: int, cache: ImageCache):
+        """
+        Decodes page images in a background thread, at most depth images are held in memory
+
+        Args:
+            pages: list of Page objects
+            depth: queue size
+            cache: decoded page images
+        """
+        self.cache = cache
+        self.__queue = queue.Queue(maxsize=depth)
+        self.__thread = threading.Thread(target=self.__run, args=(pages,), daemon=True)
+        self.__thread.start()
+
+    def __run(self, pages: list) -> None:
+        try:
+            for page in pages:
+                self.__queue.put((page, self.cache.get(page.file, page.image_index)))  # cv2 releases the GIL
+        except BaseException as e:
+            self.__queue.put(e)  # raised by the consumer
+        finally:
+            self.__queue.put(None)
+
+    def __iter__(self):
+        while (item := self.__queue.get()) is not None:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def close(self) -> None:
+        """
+        Drains the queue, so the reader thread can finish
+        """
+        while self.__thread.is_alive():
+            try:
+                self.__queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def write_line(output_dir: Path, filename: str, cropped: numpy.ndarray, text: str, encode_only: bool):
+    """
+    Encodes and writes a single line
+
+    Args:
+        output_dir: where ground truth data will be stored
+        filename: line base name
+        cropped: line image
+        text: line text
+        encode_only: return encoded line instead of writing files
+
+    Returns:
+        (base name, png bytes, text) if encode_only, else None
+    """
+    with stage('encode'):
+        png = cv2.imencode('.png', cropped)[1]
+    if encode_only:
+        return filename, png.tobytes(), text
+    with stage('write'):
+        with open(output_dir.joinpath(filename + '.png').as_posix(), 'wb') as f:
+            f.write(png.data)
+        with open(output_dir.joinpath(filename + '.gt.txt').as_posix(), 'w', encoding='utf-8') as f:
+            f.write(text)
+    return None
+
+
+def crop_document(xml: Document, output_dir: Path, written: list = None, records: list = None,
+                  options: PipelineOptions = None) -> tuple:
+    """
+    Writes line image and text files for every line of a Document object.
+    Page decoding, cropping and line encoding/writing run in overlapping stages with bounded queues.
+
+    Args:
+        xml: Document object
+        output_dir: where ground truth data will be stored
+        written: optional list, base names of written lines are appended
+        records: optional list, (base name, png bytes, text) is appended instead of writing files
+        options: pipeline queue depths and thread counts
+
+    Returns:
+        (line count, region count, page count)
+    """
+    options = options or PipelineOptions()
+    if records is None:
+        os.makedirs(output_dir.as_posix(), exist_ok=True)
 
     page_counter: int = 0
     region_counter: int = 0
     line_counter: int = 0
 
-    for page in xml.pages:
-        img = cv2.imread(page.file)
-        mask = numpy.zeros((page.height, page.width), dtype=numpy.uint8)
-        for region in page.text_regions:
-            for line in region.text_lines:
-                cv2.fillPoly(mask, numpy.int32([numpy.array(line.coords, dtype=numpy.int32)]), (255, 255, 255))
-                res = cv2.bitwise_and(img, img, mask=mask)
-                rect = cv2.boundingRect(numpy.array(line.coords, dtype=numpy.int32))
-                bg = numpy.full((res.shape[0], res.shape[1], 3), (255, 255, 255), dtype=numpy.uint8)
-                mask_inverted = cv2.bitwise_not(mask)
-                bg_cropped = cv2.bitwise_or(bg, bg, mask=mask_inverted)
-                final_img = res + bg_cropped
-                cropped = final_img[rect[1]: rect[1] + rect[3], rect[0]: rect[0] + rect[2]]
-
-                filename = f'{xml.id}-{page.id}-{region.id}-{line.id}'
-                cv2.imwrite(output_dir.joinpath(filename + '.png').as_posix(), cropped)
-                with open(output_dir.joinpath(filename + '.gt.txt').as_posix(), 'w', encoding='utf-8') as f:
-                    f.write(line.text)
-
-                line_counter += 1
-            region_counter += 1
-        page_counter += 1
-    return f'Cropped {line_counter} line(s) from {region_counter} region(s) on {page_counter} page(s)'
+    cache = image_cache(options.cache_bytes, options.grayscale or options.height > 0)
+    cache.plan(xml.pages)
+    if options.prefetch > 0:
+        pages = PageReader(xml.pages, options.prefetch, cache)
+    else:
+        pages = ((page, cache.get(page.file, page.image_index)) for page in xml.pages)
+    writer = ThreadPoolExecutor(max_workers=options.writers) if options.writers > 0 else None
+    slots = threading.BoundedSemaphore(max(options.write_queue, 1))
+    pending = []  # write results in line order
+
+    try:
+        for page, img in pages:
+            if img is None:
+                print(f'\tSkipping page {page.id}: missing or unreadable image {page.file}')
+                continue  # ignore page without image data
+            normalizer = None
+            if options.height > 0:
+                with stage('normalize'):
+                    normalizer = LineNormalizer(img, options.height, options.binarize)
+                    img = normalizer.page
+            cropper = LineCropper(img)
+            for region in page.text_regions:
+                for line in region.text_lines:
+                    with stage('crop'):
+                        cropped = cropper.crop(line.coords)
+                    if cropped is None:
+                        print(f'\tTextLine outside of image: {line.id}')
+                        continue  # ignore line without image data
+                    if normalizer is not None:
+                        with stage('normalize'):
+                            cropped = normalizer.normalize(cropped)
+
+                    filename = f'{xml.id}-{page.id}-{region.id}-{line.id}'
+                    args = (output_dir, filename, cropped, line.text, records is not None)
+                    if writer is None:
+                        pending.append(write_line(*args))
+                    else:
+                        slots.acquire()  # blocks while write_queue lines are waiting
+                        future = writer.submit(write_line, *args[:2], cropped.copy(), *args[3:])  # buffer is reused
+                        future.add_done_callback(lambda _: slots.release())
+                        pending.append(future)
+                    if written is not None:
+                        written.append(filename)
+
+                    line_counter += 1
+                region_counter += 1
+            page_counter += 1
+    finally:
+        if isinstance(pages, PageReader):
+            pages.close()
+        if writer is not None:
+            writer.shutdown(wait=True)
+        cache.clear()  # decoded pages are not kept after the document
+
+    results = [result.result() if writer is not None else result for result in pending]  # raises write errors
+    if records is not None:
+        records.extend(results)
+    return line_counter, region_counter, page_counter
+
+
+def line_gt_summary(lines: int, regions: int, pages: int) -> str:
+    """
+    Formats counts returned by crop_document
+
+    Returns:
+        status string
+    """
+    return f'Cropped {lines} line(s) from {regions} region(s) on {pages} page(s)'
+
+
+def line_gt_worker(task: tuple) -> tuple:
+    """
+    Process pool entry point for ground truth generation. Console output is captured, so it can be printed in order
+    by the main process.
+
+    Args:
+        task: (PageXML file or Document object, output_dir, return encoded lines instead of writing files,
+               PipelineOptions)
+
+    Returns:
+        ((line count, region count, page count), written line base names or (base name, png bytes, text) records,
+        page image files, captured console output)
+    """
+    source, output_dir, pack, options = task
+    log = io.StringIO()
+    written = []
+    with redirect_stdout(log):
+        if isinstance(source, Document):
+            xml = source
+        else:
+            with stage('parse'):
+                xml = parse_pagexml(source, (options or PipelineOptions()).parser)
+        counts = crop_document(xml, output_dir, None if pack else written, written if pack else None, options)
+    return counts, written, [page.file for page in xml.pages], log.getvalue()
@@ -0,0 +1,48 @@
+import re
+
+import numpy
+
+
+POINTS_PATTERN = re.compile(r'\s*-?\d{1,10},-?\d{1,10}(?:\s+-?\d{1,10},-?\d{1,10})*\s*')  # 10 digits fit int64
+INT32 = numpy.iinfo(numpy.int32)
+
+
+class CoordsError(ValueError):
+    pass
+
+
+def parse_points(points: str) -> numpy.ndarray:
+    """
+    Parses PageXML Coords/Baseline points string in bulk
+
+    Args:
+        points: points string 'x0,y0 x1,y1 ...'
+
+    Returns:
+        int32 array of shape (n, 2)
+
+    Raises:
+        CoordsError: on missing or malformed points, or values outside the int32 range
+    """
+    if points is None:
+        raise CoordsError('missing points')
+    if POINTS_PATTERN.fullmatch(points) is None:
+        raise CoordsError(f'malformed points "{points if len(points) <= 40 else points[:40] + "..."}"')
+    values = numpy.fromstring(points.replace(',', ' '), dtype=numpy.int64, sep=' ')
+    if values.min() < INT32.min or values.max() > INT32.max:
+        raise CoordsError(f'points out of range "{points if len(points) <= 40 else points[:40] + "..."}"')
+    return values.astype(numpy.int32).reshape(-1, 2)
+
+
+def format_points(coords) -> str:
+    """
+    Formats coords to PageXML points string
+
+    Args:
+        coords: int array of shape (n, 2) or nested coords list [[x0, y0],...]
+
+    Returns:
+        points string 'x0,y0 x1,y1 ...'
+    """
+    flat = numpy.asarray(coords, dtype=numpy.int64).ravel().tolist()
+    return ('%d,%d ' * (len(flat) // 2) % tuple(flat))[:-1]
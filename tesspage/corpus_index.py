@@ -0,0 +1,265 @@
+import io
+import os
+import sqlite3
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from functools import partial
+from pathlib import Path
+
+from tesspage.helper import file_hash, file_list, ordered_imap
+
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY, file TEXT UNIQUE NOT NULL, source TEXT NOT NULL, name TEXT NOT NULL,
+    mtime REAL NOT NULL, size INTEGER NOT NULL, hash TEXT NOT NULL, creator TEXT, created TEXT, last_change TEXT
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY, document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    page_id TEXT NOT NULL, image TEXT, width INTEGER, height INTEGER
+);
+CREATE TABLE IF NOT EXISTS regions (
+    id INTEGER PRIMARY KEY, page_id INTEGER NOT NULL REFERENCES pages(id) ON DELETE CASCADE,
+    region_id TEXT NOT NULL, x0 INTEGER, y0 INTEGER, x1 INTEGER, y1 INTEGER
+);
+CREATE TABLE IF NOT EXISTS lines (
+    id INTEGER PRIMARY KEY, region_id INTEGER NOT NULL REFERENCES regions(id) ON DELETE CASCADE,
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    line_id TEXT NOT NULL, name TEXT NOT NULL, x0 INTEGER, y0 INTEGER, x1 INTEGER, y1 INTEGER,
+    text TEXT NOT NULL, length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chars (
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    char TEXT NOT NULL, count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_document ON pages(document_id);
+CREATE INDEX IF NOT EXISTS regions_page ON regions(page_id);
+CREATE INDEX IF NOT EXISTS lines_region ON lines(region_id);
+CREATE INDEX IF NOT EXISTS lines_document ON lines(document_id);
+CREATE INDEX IF NOT EXISTS lines_length ON lines(length);
+CREATE INDEX IF NOT EXISTS chars_document ON chars(document_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS lines_fts USING fts5(
+    text, content='lines', content_rowid='id', tokenize='trigram case_sensitive 1'
+);
+CREATE TRIGGER IF NOT EXISTS lines_insert AFTER INSERT ON lines BEGIN
+    INSERT INTO lines_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS lines_delete AFTER DELETE ON lines BEGIN
+    INSERT INTO lines_fts(lines_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+
+def index_worker(file: Path, backend: str = 'lxml') -> tuple:
+    """
+    Process pool entry point, parses a single PageXML file into plain records. Console output is captured, so it can
+    be printed in order by the main process.
+
+    Args:
+        file: PageXML file
+        backend: PageXML parser backend
+
+    Returns:
+        (content hash, (creator, created, last change), pages, captured console output), pages is None on failure
+        pages: [(page id, image, width, height, [(region id, bbox, [(line id, name, bbox, text)])])]
+    """
+    from tesspage.pagexml_parser import parse_pagexml
+
+    log = io.StringIO()
+    with redirect_stdout(log):
+        try:
+            doc = parse_pagexml(file, backend)
+        except Exception as e:
+            print(f'\t{type(e).__name__}: {e}')
+            return file_hash(file), None, None, log.getvalue()
+    pages = [(page.id, page.file, page.width, page.height,
+              [(region.id, region.bbox,
+                [(line.id, f'{doc.id}-{page.id}-{region.id}-{line.id}', line.bbox, line.text)
+                 for line in region.text_lines])
+               for region in page.text_regions])
+             for page in doc.pages]
+    return file_hash(file), (doc.creator, doc.created, doc.last_change), pages, log.getvalue()
+
+
+class CorpusIndex:
+    def __init__(self, database: Path):
+        """
+        SQLite index of parsed PageXML documents with a full text index of the line texts
+
+        Args:
+            database: SQLite file, created if missing, rebuilt on schema changes
+        """
+        self.database = database
+        if database.exists() and self.__version(database) not in (0, SCHEMA_VERSION):
+            print(f'Rebuilding index of an older version: {database}')
+            database.unlink()
+        self.db = sqlite3.connect(database.as_posix())
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.executescript(SCHEMA)
+        self.db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    @staticmethod
+    def __version(database: Path) -> int:
+        with sqlite3.connect(database.as_posix()) as db:
+            return db.execute('PRAGMA user_version').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.db.close()
+
+    def update(self, input_dir: Path, jobs: int = 1, backend: str = 'lxml') -> tuple:
+        """
+        Indexes new and changed PageXML files of a folder and removes documents whose file is gone.
+        Files with unchanged mtime and size are skipped without reading them, touched files with unchanged content
+        are not parsed again.
+
+        Args:
+            input_dir: PageXML folder
+            jobs: number of parser workers
+            backend: PageXML parser backend
+
+        Returns:
+            (indexed documents, unchanged documents, removed documents)
+        """
+        from tesspage.pagexml_parser import parser_backend
+        parser_backend(backend)  # fail before the index is changed
+
+        source = input_dir.as_posix()
+        known = {file: (doc_id, mtime, size, digest) for doc_id, file, mtime, size, digest in self.db.execute(
+            'SELECT id, file, mtime, size, hash FROM documents WHERE source = ?', (source,))}
+        files = file_list(input_dir, 'xml')
+        stats = {file: file.stat() for file in files}
+        todo = [file for file in files if known.get(file.as_posix(), (None,))[1:3] != (stats[file].st_mtime,
+                                                                                        stats[file].st_size)]
+        current = {file.as_posix() for file in files}
+        removed = [doc_id for file, (doc_id, *_) in known.items() if file not in current]
+        indexed = 0
+        with self.db:  # single transaction, an interrupted update leaves the previous index
+            for doc_id in removed:
+                self.db.execute('DELETE FROM documents WHERE id = ?', (doc_id,))
+
+            todo = [file for file in todo if not self.__touched(file, stats[file], known.get(file.as_posix()))]
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                for file, (digest, meta, pages, log) in ordered_imap(pool, partial(index_worker, backend=backend), todo,
+                                                                     depth=4 * jobs):
+                    if log:
+                        print(f'{file.name}:\n{log}', end='')
+                    entry = known.get(file.as_posix())
+                    if entry is not None:
+                        self.db.execute('DELETE FROM documents WHERE id = ?', (entry[0],))
+                    if pages is not None:
+                        self.__insert(file, stats[file], digest, meta, pages)
+                        indexed += 1
+        return indexed, len(files) - len(todo), len(removed)
+
+    def __touched(self, file: Path, stat: os.stat_result, entry) -> bool:
+        """
+        Updates mtime of a file that was touched, but not changed
+
+        Returns:
+            True if the content hash is unchanged
+        """
+        if entry is None or entry[2] != stat.st_size or entry[3] != file_hash(file):
+            return False
+        self.db.execute('UPDATE documents SET mtime = ? WHERE id = ?', (stat.st_mtime, entry[0]))
+        return True
+
+    def __insert(self, file: Path, stat: os.stat_result, digest: str, meta: tuple, pages: list) -> None:
+        cur = self.db.execute(
+            'INSERT INTO documents (file, source, name, mtime, size, hash, creator, created, last_change) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (file.as_posix(), file.parent.as_posix(), file.name, stat.st_mtime, stat.st_size, digest, *meta))
+        doc_id = cur.lastrowid
+        chars = Counter()
+        for page_id, image, width, height, regions in pages:
+            page_row = self.db.execute('INSERT INTO pages (document_id, page_id, image, width, height) '
+                                       'VALUES (?, ?, ?, ?, ?)', (doc_id, page_id, image, width, height)).lastrowid
+            for region_id, bbox, lines in regions:
+                region_row = self.db.execute('INSERT INTO regions (page_id, region_id, x0, y0, x1, y1) '
+                                             'VALUES (?, ?, ?, ?, ?, ?)',
+                                             (page_row, region_id, *(bbox or (None,) * 4))).lastrowid
+                self.db.executemany(
+                    'INSERT INTO lines (region_id, document_id, line_id, name, x0, y0, x1, y1, text, length) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(region_row, doc_id, line_id, name, *(line_bbox or (None,) * 4), text, len(text))
+                     for line_id, name, line_bbox, text in lines])
+                for *_, text in lines:
+                    chars.update(text)
+        self.db.executemany('INSERT INTO chars (document_id, char, count) VALUES (?, ?, ?)',
+                            [(doc_id, char, count) for char, count in chars.items()])
+
+    def query(self, text: str, limit: int = 20) -> list:
+        """
+        Lines containing text (case sensitive substring). Uses the trigram index, shorter texts (single rare glyphs)
+        are searched in the line table.
+
+        Args:
+            text: searched text
+            limit: max number of lines, 0 for all
+
+        Returns:
+            list of (line name, document file, text) in document order
+        """
+        if len(text) >= 3:
+            sql = ('SELECT lines.name, documents.file, lines.text FROM lines_fts '
+                   'JOIN lines ON lines.id = lines_fts.rowid JOIN documents ON documents.id = lines.document_id '
+                   'WHERE lines_fts MATCH ? ORDER BY lines.id')
+            args = ['"' + text.replace('"', '""') + '"']
+        else:
+            sql = ('SELECT lines.name, documents.file, lines.text FROM lines '
+                   'JOIN documents ON documents.id = lines.document_id WHERE instr(lines.text, ?) > 0 ORDER BY lines.id')
+            args = [text]
+        if limit > 0:
+            sql += ' LIMIT ?'
+            args.append(limit)
+        return self.db.execute(sql, args).fetchall()
+
+    def stats(self) -> dict:
+        """
+        Corpus statistics
+
+        Returns:
+            dict of totals, line length percentiles, line length histogram (10 character bins) and
+            (documents, pages, lines) per source folder
+        """
+        one = lambda sql: self.db.execute(sql).fetchone()[0]  # noqa: E731
+        lines = one('SELECT count(*) FROM lines')
+        stats = {
+            'documents': one('SELECT count(*) FROM documents'),
+            'pages': one('SELECT count(*) FROM pages'),
+            'regions': one('SELECT count(*) FROM regions'),
+            'lines': lines,
+            'characters': one('SELECT coalesce(sum(count), 0) FROM chars'),
+            'distinct_characters': one('SELECT count(DISTINCT char) FROM chars'),
+            'length': {},
+        }
+        for name, q in (('min', 0), ('median', 0.5), ('p95', 0.95), ('max', 1)):
+            if lines:
+                offset = min(int(q * lines), lines - 1)
+                stats['length'][name] = self.db.execute('SELECT length FROM lines ORDER BY length LIMIT 1 OFFSET ?',
+                                                        (offset,)).fetchone()[0]
+        stats['histogram'] = self.db.execute('SELECT length / 10 * 10, count(*) FROM lines GROUP BY 1 ORDER BY 1'
+                                             ).fetchall()
+        stats['sources'] = self.db.execute(
+            'SELECT source, count(DISTINCT documents.id), '
+            '(SELECT count(*) FROM pages JOIN documents d ON d.id = pages.document_id WHERE d.source = documents.source), '
+            'count(lines.id) FROM documents LEFT JOIN lines ON lines.document_id = documents.id '
+            'GROUP BY source ORDER BY source').fetchall()
+        return stats
+
+    def chars(self) -> list:
+        """
+        Character inventory
+
+        Returns:
+            list of (character, count, number of documents), most frequent first
+        """
+        return self.db.execute('SELECT char, sum(count), count(*) FROM chars GROUP BY char ORDER BY 2 DESC, 1'
+                               ).fetchall()
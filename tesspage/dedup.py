@@ -0,0 +1,151 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy
+
+from tesspage.helper import ordered_imap
+from tesspage.manifest import GTManifest
+from tesspage.training import line_image
+
+HASH_BANDS = 4  # 64 bit image hash split into 16 bit bands, lines within HASH_BANDS - 1 bits share a band
+LINE_SUFFIXES = ('.gt.txt', '.png', '.bin.png', '.nrm.png', '.tif', '.box', '.lstmf')  # files of a line
+REPORT_HEADER = 'name\tduplicate_of\tdistance\tbytes\n'
+
+
+def image_hash(img: numpy.ndarray) -> int:
+    """
+    Difference hash of a line image: the image is shrunk to 9x8 pixels, every bit compares two neighbouring pixels.
+    Robust against scaling, compression and contrast changes of the same scan.
+
+    Args:
+        img: single channel line image
+
+    Returns:
+        64 bit hash
+    """
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(numpy.packbits(bits).tobytes(), 'big')
+
+
+def text_hash(text: str) -> str:
+    """
+    Hash of a line text, whitespace is normalized
+    """
+    return hashlib.sha1(' '.join(text.split()).encode('utf-8')).hexdigest()
+
+
+def hash_worker(base: str):
+    """
+    Process pool entry point, hashes a single line
+
+    Args:
+        base: line path without extension
+
+    Returns:
+        (text hash, image hash, bytes of all line files), error message on failure
+    """
+    try:
+        image = line_image(Path(base + '.gt.txt'))
+        if image is None:
+            raise FileNotFoundError('missing line image')
+        with open(base + '.gt.txt', 'r', encoding='utf-8') as f:
+            text = f.read()
+        img = cv2.imread(image.as_posix(), cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise ValueError(f'unreadable image {image.name}')
+        size = sum(os.path.getsize(base + suffix) for suffix in LINE_SUFFIXES if os.path.isfile(base + suffix))
+        return text_hash(text), image_hash(img), size
+    except Exception as e:
+        return f'{type(e).__name__}: {e}'
+
+
+class DuplicateIndex:
+    def __init__(self, max_distance: int = 3):
+        """
+        Finds lines with equal text and similar image. Kept lines are indexed by (text hash, band of the image hash),
+        so a new line is only compared with the few lines sharing its text and one band instead of all lines.
+
+        Args:
+            max_distance: max number of differing image hash bits, at most HASH_BANDS - 1
+        """
+        if not 0 <= max_distance < HASH_BANDS:
+            raise ValueError(f'max_distance must be between 0 and {HASH_BANDS - 1}')
+        self.max_distance = max_distance
+        self.__buckets = {}  # (text hash, band, band value) -> [(image hash, name)]
+
+    @staticmethod
+    def __keys(text: str, image: int):
+        width = 64 // HASH_BANDS
+        for band in range(HASH_BANDS):
+            yield text, band, (image >> (band * width)) & ((1 << width) - 1)
+
+    def add(self, name: str, text: str, image: int):
+        """
+        Adds a line unless it duplicates an already added line
+
+        Args:
+            name: line base name
+            text: text hash
+            image: image hash
+
+        Returns:
+            (name of the kept line, hash distance) of a duplicate, None if the line was added
+        """
+        keys = list(self.__keys(text, image))
+        for key in keys:
+            for other, other_name in self.__buckets.get(key, ()):
+                distance = bin(image ^ other).count('1')
+                if distance <= self.max_distance:
+                    return other_name, distance
+        for key in keys:
+            self.__buckets.setdefault(key, []).append((image, name))
+        return None
+
+
+def deduplicate(ground_truth_dir: Path, jobs: int = 1, max_distance: int = 3, drop: bool = False,
+                report_file: Path = None) -> tuple:
+    """
+    Finds duplicate lines of a ground truth folder, the first line in name order is kept
+
+    Args:
+        ground_truth_dir: folder with line images and .gt.txt files
+        jobs: number of hashing workers
+        max_distance: max number of differing image hash bits of a duplicate
+        drop: delete files of duplicate lines (image, text, .box, .lstmf)
+        report_file: optional TSV file listing every duplicate
+
+    Returns:
+        (number of lines, number of duplicates, bytes of duplicates)
+    """
+    bases = [gt_file.as_posix()[:-len('.gt.txt')] for gt_file in sorted(ground_truth_dir.glob('*.gt.txt'))]
+    index = DuplicateIndex(max_distance)
+    duplicates = []  # (name, kept name, distance, bytes)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for base, result in ordered_imap(pool, hash_worker, bases, depth=64 * jobs):
+            name = os.path.basename(base)
+            if isinstance(result, str):
+                print(f'{name}: {result}')
+                continue
+            text, image, size = result
+            duplicate = index.add(name, text, image)
+            if duplicate is not None:
+                duplicates.append((name, *duplicate, size))
+
+    if report_file is not None:
+        with open(report_file.as_posix(), 'w', encoding='utf-8') as f:
+            f.write(REPORT_HEADER)
+            for row in duplicates:
+                f.write('\t'.join(str(x) for x in row) + '\n')
+    if drop and duplicates:
+        for name, *_ in duplicates:
+            for suffix in LINE_SUFFIXES:
+                ground_truth_dir.joinpath(name + suffix).unlink(missing_ok=True)
+        manifest = GTManifest(ground_truth_dir)
+        if manifest.documents:
+            manifest.forget({name for name, *_ in duplicates})  # incremental generate must not recreate them
+            manifest.save()
+    return len(bases), len(duplicates), sum(row[3] for row in duplicates)
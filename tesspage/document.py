@@ -1,31 +1,97 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 
+import numpy
 
-@dataclass()
-class TextLine:
+
+def as_coords(coords) -> numpy.ndarray:
+    """
+    Converts coords to a contiguous int32 array
+
+    Args:
+        coords: nested coords list [[x0, y0],...] or array
+
+    Returns:
+        int32 array of shape (n, 2)
+    """
+    return numpy.ascontiguousarray(coords, dtype=numpy.int32).reshape(-1, 2)
+
+
+def empty_coords() -> numpy.ndarray:
+    return numpy.empty((0, 2), dtype=numpy.int32)
+
+
+class Comparable:
+    """ Value equality for slotted dataclasses with coords arrays """
+    __slots__ = ()
+
+    def __eq__(self, other) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        for f in fields(self):
+            if not f.compare:
+                continue
+            a, b = getattr(self, f.name), getattr(other, f.name)
+            if isinstance(a, numpy.ndarray) or isinstance(b, numpy.ndarray):
+                if not numpy.array_equal(a, b):
+                    return False
+            elif a != b:
+                return False
+        return True
+
+
+class Bounded(Comparable):
+    """ Cached bounding box of coords """
+    __slots__ = ()
+
+    @property
+    def bbox(self) -> tuple:
+        """
+        Bounding box, computed on first access
+
+        Returns:
+            (x0, y0, x1, y1), None for empty coords
+        """
+        if self._bbox is None and len(self.coords):
+            self._bbox = (*self.coords.min(axis=0).tolist(), *self.coords.max(axis=0).tolist())
+        return self._bbox
+
+
+@dataclass(slots=True, eq=False)
+class TextLine(Bounded):
     id: str
     text: str = ''
-    coords: list = field(default_factory=list)
+    coords: numpy.ndarray = field(default_factory=empty_coords)  # int32 (n, 2), view into page buffer
+    conf: float = None  # mean word confidence 0..1 (hOCR), None if unknown
+    _bbox: tuple = field(default=None, init=False, repr=False, compare=False)
 
+    def __post_init__(self):
+        self.coords = as_coords(self.coords)
 
-@dataclass()
-class TextRegion:
+
+@dataclass(slots=True, eq=False)
+class TextRegion(Bounded):
     id: str
-    coords: list = field(default_factory=list)
+    coords: numpy.ndarray = field(default_factory=empty_coords)  # int32 (n, 2), view into page buffer
     text_lines: list = field(default_factory=list)
+    _bbox: tuple = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.coords is not None:
+            self.coords = as_coords(self.coords)
 
 
-@dataclass()
-class Page:
+@dataclass(slots=True, eq=False)
+class Page(Comparable):
     id: str
     file: str
     height: int
     width: int
     text_regions: list = field(default_factory=list)  # order in list == reading order
+    image_index: int = 0  # page within a multi-page image file
 
 
-@dataclass
-class Document:
+@dataclass(slots=True, eq=False)
+class Document(Comparable):
     id: str
     file: str
     creator: str = ''
@@ -34,6 +100,25 @@ class Document:
     pages: list = field(default_factory=list)
 
 
+def pack_coords(page: Page) -> None:
+    """
+    Moves coords of all regions and lines of a page into one shared int32 buffer, coords become views into it
+
+    Args:
+        page: Page object
+    """
+    items = [item for region in page.text_regions for item in (region, *region.text_lines)]
+    arrays = [as_coords(item.coords) for item in items]
+    if not arrays:
+        return
+    buffer = numpy.concatenate(arrays)
+    start = 0
+    for item, array in zip(items, arrays):
+        item.coords = buffer[start:start + len(array)]
+        item._bbox = None
+        start += len(array)
+
+
 def page_to_string(page: Page) -> str:
     """
     Converts page object to single string
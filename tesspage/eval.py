@@ -1,5 +1,100 @@
+import csv
+import json
+import re
+import unicodedata
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
 import dinglehopper
+import numpy
+from rapidfuzz import process
 from rapidfuzz.distance import Levenshtein
+from uniseg.graphemecluster import grapheme_clusters
+
+from tesspage.document import Document
+from tesspage.helper import file_to_document, file_to_string, load_state, save_state
+from tesspage.metrics import stage
+from tesspage.shard import complete_parts
+
+# anything outside of the Latin-1 and Latin Extended blocks or CR (CR LF is one cluster) may join its neighbours to a
+# single grapheme cluster, such texts are segmented with uniseg
+NEEDS_SEGMENTATION = re.compile(r'[^\x00-\x0c\x0e-\u02ff]')
+
+
+@dataclass()
+class EvalResult:
+    cer: float
+    wer: float
+    distance: int  # grapheme level
+    word_distance: int
+    characters: int  # reference length in graphemes
+    words: int  # reference length in words
+
+
+def graphemes(text: str):
+    """
+    Splits NFC normalized text into grapheme clusters. Texts of code points below U+0300 without CR are returned as
+    they are (one code point per grapheme), all other texts are segmented with uniseg like dinglehopper does
+
+    Args:
+        text: NFC normalized string
+
+    Returns:
+        str or list of grapheme clusters
+    """
+    if NEEDS_SEGMENTATION.search(text) is None:
+        return text
+    return list(grapheme_clusters(text))
+
+
+def error_rate(distance: int, length: int) -> float:
+    """
+    Error rate as defined by dinglehopper
+
+    Args:
+        distance: edit distance
+        length: reference length
+
+    Returns:
+        rate float, inf for an empty reference with errors
+    """
+    if distance == 0:
+        return 0.0
+    if length == 0:
+        return float('inf')
+    return distance / length
+
+
+def evaluate_text(ground_truth: str, prediction: str) -> EvalResult:
+    """
+    Calculates CER, WER and Levenshtein distance with a single normalization and segmentation per string
+
+    Args:
+        ground_truth: ground truth string
+        prediction: prediction string
+
+    Returns:
+        EvalResult object
+    """
+    gt = unicodedata.normalize('NFC', ground_truth)
+    pred = unicodedata.normalize('NFC', prediction)
+
+    gt_chars, pred_chars = graphemes(gt), graphemes(pred)
+    if isinstance(gt_chars, str) != isinstance(pred_chars, str):
+        gt_chars, pred_chars = list(gt_chars), list(pred_chars)  # compare as sequences of the same type
+    distance = Levenshtein.distance(gt_chars, pred_chars)
+
+    gt_words, pred_words = list(dinglehopper.words(gt)), list(dinglehopper.words(pred))
+    word_distance = Levenshtein.distance(gt_words, pred_words)
+
+    return EvalResult(
+        cer=error_rate(distance, len(gt_chars)),
+        wer=error_rate(word_distance, len(gt_words)),
+        distance=distance,
+        word_distance=word_distance,
+        characters=len(gt_chars),
+        words=len(gt_words),
+    )
 
 
 def evaluate_cer(ground_truth: str, prediction: str) -> float:
@@ -42,3 +137,296 @@ def levenshtein_distance(ground_truth: str, prediction: str) -> int:
         distance int
     """
     return Levenshtein.distance(ground_truth, prediction)
+
+
+def document_lines(doc: Document) -> list:
+    """
+    Flattens a Document object to its lines in reading order
+
+    Args:
+        doc: Document object
+
+    Returns:
+        list of (page index, TextLine)
+    """
+    return [(index, line) for index, page in enumerate(doc.pages) for region in page.text_regions
+            for line in region.text_lines]
+
+
+def line_boxes(lines: list) -> numpy.ndarray:
+    """
+    Bounding boxes of lines
+
+    Args:
+        lines: list of (page index, TextLine)
+
+    Returns:
+        int array of (x0, y0, x1, y1), -1 for lines without coords
+    """
+    boxes = numpy.full((len(lines), 4), -1, dtype=numpy.int64)
+    for i, (_, line) in enumerate(lines):
+        if line.bbox is not None:
+            boxes[i] = line.bbox
+    return boxes
+
+
+def greedy_assignment(scores: numpy.ndarray, threshold: float, maximize: bool) -> list:
+    """
+    Assigns rows to columns, best scores first, every row and column is used once
+
+    Args:
+        scores: row x column score matrix
+        threshold: pairs must be >= (maximize) or < (minimize) threshold
+        maximize: higher scores are better
+
+    Returns:
+        list of (row, column)
+    """
+    order = numpy.argsort(-scores if maximize else scores, axis=None, kind='stable')
+    rows, cols = numpy.unravel_index(order, scores.shape)
+    used_rows, used_cols, pairs = set(), set(), []
+    for r, c in zip(rows.tolist(), cols.tolist()):
+        score = scores[r, c]
+        if (score < threshold) if maximize else (score >= threshold):
+            break
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        pairs.append((r, c))
+    return pairs
+
+
+def match_lines(ref_lines: list, pred_lines: list, min_overlap: float = 0.5) -> list:
+    """
+    Pairs reference and prediction lines: by id, then by bounding box overlap (IoU) on the same page,
+    then by text similarity of all remaining lines
+
+    Args:
+        ref_lines: list of (page index, TextLine)
+        pred_lines: list of (page index, TextLine)
+        min_overlap: minimal IoU for geometric pairing
+
+    Returns:
+        list of (reference index or None, prediction index or None), reference order, unmatched predictions last
+    """
+    pairs = {}
+    pred_ids = {line.id: i for i, (_, line) in enumerate(pred_lines)}
+    for i, (page, line) in enumerate(ref_lines):
+        j = pred_ids.pop(line.id, None)  # every prediction line is used once
+        if j is not None and pred_lines[j][0] == page:
+            pairs[i] = j
+
+    # geometric overlap
+    rest_ref = [i for i in range(len(ref_lines)) if i not in pairs]
+    rest_pred = sorted(set(range(len(pred_lines))) - set(pairs.values()))
+    if rest_ref and rest_pred:
+        a = line_boxes([ref_lines[i] for i in rest_ref])[:, None, :]
+        b = line_boxes([pred_lines[j] for j in rest_pred])[None, :, :]
+        w = (numpy.minimum(a[..., 2], b[..., 2]) - numpy.maximum(a[..., 0], b[..., 0])).clip(0)
+        h = (numpy.minimum(a[..., 3], b[..., 3]) - numpy.maximum(a[..., 1], b[..., 1])).clip(0)
+        intersection = w * h
+        area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+        area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+        union = area_a + area_b - intersection
+        iou = numpy.divide(intersection, union, out=numpy.zeros(intersection.shape), where=union > 0)
+        same_page = (numpy.array([ref_lines[i][0] for i in rest_ref])[:, None] ==
+                     numpy.array([pred_lines[j][0] for j in rest_pred])[None, :])
+        valid = (a[..., 0] >= 0) & (b[..., 0] >= 0) & same_page
+        for r, c in greedy_assignment(numpy.where(valid, iou, 0), min_overlap, maximize=True):
+            pairs[rest_ref[r]] = rest_pred[c]
+
+    # text similarity, all distances at once, single threaded as eval runs one document per pool worker
+    rest_ref = [i for i in range(len(ref_lines)) if i not in pairs]
+    rest_pred = sorted(set(range(len(pred_lines))) - set(pairs.values()))
+    if rest_ref and rest_pred:
+        distances = process.cdist([ref_lines[i][1].text for i in rest_ref], [pred_lines[j][1].text for j in rest_pred],
+                                  scorer=Levenshtein.normalized_distance, workers=1)
+        for r, c in greedy_assignment(distances, 1.0, maximize=False):
+            pairs[rest_ref[r]] = rest_pred[c]
+
+    matched = set(pairs.values())
+    return ([(i, pairs.get(i)) for i in range(len(ref_lines))] +
+            [(None, j) for j in range(len(pred_lines)) if j not in matched])
+
+
+def evaluate_lines(ref_doc: Document, pred_doc: Document) -> tuple:
+    """
+    Line-level evaluation of two Document objects
+
+    Args:
+        ref_doc: reference Document object
+        pred_doc: prediction Document object
+
+    Returns:
+        (EvalResult of all lines, list of per-line result dicts)
+    """
+    ref_lines, pred_lines = document_lines(ref_doc), document_lines(pred_doc)
+    with stage('align', items=len(ref_lines)):
+        pairs = match_lines(ref_lines, pred_lines)
+    with stage('distance', items=len(pairs)):
+        return _evaluate_pairs(ref_lines, pred_lines, pairs)
+
+
+def _evaluate_pairs(ref_lines: list, pred_lines: list, pairs: list) -> tuple:
+    """
+    Evaluates aligned lines, see evaluate_lines
+    """
+    lines = []
+    totals = [0, 0, 0, 0]  # distance, word distance, characters, words
+    for i, j in pairs:
+        ref = ref_lines[i][1] if i is not None else None
+        pred = pred_lines[j][1] if j is not None else None
+        result = evaluate_text(ref.text if ref else '', pred.text if pred else '')
+        lines.append(dict(reference_id=ref.id if ref else None, prediction_id=pred.id if pred else None,
+                          reference=ref.text if ref else '', prediction=pred.text if pred else '', **asdict(result)))
+        totals = [t + v for t, v in zip(totals, (result.distance, result.word_distance, result.characters,
+                                                 result.words))]
+    return EvalResult(
+        cer=error_rate(totals[0], totals[2]),
+        wer=error_rate(totals[1], totals[3]),
+        distance=totals[0],
+        word_distance=totals[1],
+        characters=totals[2],
+        words=totals[3],
+    ), lines
+
+
+def prediction_file(ref_path: Path) -> Path:
+    """
+    Prediction file matching a reference file (<name>.gt.<extension> -> <name>.<extension>)
+
+    Args:
+        ref_path: reference file
+
+    Returns:
+        prediction file path
+    """
+    return ref_path.parent.joinpath('.'.join(ref_path.name.split('.')[0:-2]) + ref_path.suffix)
+
+
+def eval_worker(task: tuple) -> tuple:
+    """
+    Process pool entry point for file evaluation
+
+    Args:
+        task: (reference file, prediction file, line-level evaluation of .xml/.hocr pairs)
+
+    Returns:
+        (EvalResult as dict or None, error message or None)
+    """
+    ref_path, pred_path, line_level = task
+    try:
+        if line_level and ref_path.suffix in ('.xml', '.hocr') and pred_path.suffix in ('.xml', '.hocr'):
+            with stage('parse', items=2):
+                ref_doc, pred_doc = file_to_document(ref_path), file_to_document(pred_path)
+            result, lines = evaluate_lines(ref_doc, pred_doc)
+            return dict(asdict(result), lines=lines), None
+        with stage('parse', items=2):
+            ref_text, pred_text = file_to_string(ref_path), file_to_string(pred_path)
+        with stage('distance'):
+            return asdict(evaluate_text(ref_text, pred_text)), None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+
+
+class EvalCache:
+    VERSION = 1
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries = load_state(path, self.VERSION).get('entries', {})
+
+    def get(self, key: str):
+        return self.entries.get(key)
+
+    def set(self, key: str, result: dict) -> None:
+        self.entries[key] = result
+
+    def save(self) -> None:
+        """
+        Writes cache atomically
+        """
+        save_state(self.path, self.VERSION, entries=self.entries)
+
+
+def eval_summary(rows: list) -> dict:
+    """
+    Mean CER and WER of all evaluated pairs
+
+    Args:
+        rows: one dict per reference file
+
+    Returns:
+        summary dict (pairs, evaluated, cer, wer), mean values are None if no pair was evaluated
+    """
+    values = [(float(row['cer']), float(row['wer'])) for row in rows if row.get('status') == 'ok']
+    summary = {'pairs': len(rows), 'evaluated': len(values), 'cer': None, 'wer': None}
+    if values:
+        summary['cer'] = sum(cer for cer, _ in values) / len(values)
+        summary['wer'] = sum(wer for _, wer in values) / len(values)
+    return summary
+
+
+def write_eval_summary(rows: list, summary: dict, target_file: Path) -> None:
+    """
+    Writes machine-readable evaluation results, format depends on file extension (.json or .csv)
+
+    Args:
+        rows: one dict per evaluated pair
+        summary: mean values
+        target_file: .json or .csv file
+    """
+    if target_file.suffix.lower() == '.csv':
+        fields = ['reference', 'prediction', 'status', 'error', 'cer', 'wer', 'distance', 'word_distance',
+                  'characters', 'words']
+        with open(target_file.as_posix(), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(target_file.as_posix(), 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'pairs': rows}, f, indent=2)
+
+
+def merge_eval_summaries(target_file: Path):
+    """
+    Combines the results of all shards of the latest sharded run into target_file, the summary is recomputed
+
+    Args:
+        target_file: .json or .csv file of an unsharded run
+
+    Returns:
+        summary dict, None if there is no complete set of shard results
+    """
+    parts = complete_parts(target_file)
+    if not parts:
+        return None
+    rows = []
+    for part in parts:
+        with open(part.as_posix(), 'r', encoding='utf-8', newline='') as f:
+            rows += list(csv.DictReader(f)) if part.suffix.lower() == '.csv' else json.load(f)['pairs']
+    rows.sort(key=lambda row: row['reference'])  # file order of an unsharded run
+    summary = eval_summary(rows)
+    write_eval_summary(rows, summary, target_file)
+    return summary
+
+
+def merge_eval_caches(cache_file: Path):
+    """
+    Combines the caches of all shards of the latest sharded run into cache_file
+
+    Args:
+        cache_file: cache file of an unsharded run
+
+    Returns:
+        number of cached pairs, None if there is no complete set of shard caches
+    """
+    parts = complete_parts(cache_file)
+    if not parts:
+        return None
+    cache = EvalCache(cache_file)
+    for part in parts:
+        cache.entries.update(EvalCache(part).entries)
+    cache.save()
+    return len(cache.entries)
@@ -1,7 +1,13 @@
+import hashlib
+import json
+import os
+from collections import deque
+from concurrent.futures import Executor
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from .hocr_parser import hocr_to_string
-from .pagexml_parser import pagexml_to_string
+if TYPE_CHECKING:
+    from .document import Document
 
 
 def abs_path(rel_path: str) -> Path:
@@ -41,9 +47,132 @@ def file_to_string(file: Path) -> str:
             text = f.read()
         return text
     elif suffix == '.hocr':
+        from .hocr_parser import hocr_to_string
         return hocr_to_string(file)
     elif suffix == '.xml':
+        from .pagexml_parser import pagexml_to_string
         return pagexml_to_string(file)
     else:
         msg = f'{file}: unsupported format'
         raise TypeError(msg)
+
+
+def file_to_document(file: Path) -> 'Document':
+    """
+    Parses .hocr or .xml (PageXML) file to Document object
+
+    Args:
+        file: file path
+
+    Returns:
+        Document object
+    """
+    if file.suffix == '.hocr':
+        from .hocr_parser import parse_hocr
+        return parse_hocr(file)
+    elif file.suffix == '.xml':
+        from .pagexml_parser import parse_pagexml
+        return parse_pagexml(file)
+    else:
+        msg = f'{file}: unsupported format'
+        raise TypeError(msg)
+
+
+def file_hash(file: Path) -> str:
+    """
+    Content hash of a file
+
+    Args:
+        file: file path
+
+    Returns:
+        sha256 hex digest
+    """
+    h = hashlib.sha256()
+    with open(file.as_posix(), 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_stat(file: Path):
+    """
+    Modification time and size of a file, a cheap change check before hashing
+
+    Args:
+        file: file path
+
+    Returns:
+        [mtime in ns, size], None if file does not exist
+    """
+    try:
+        stat = file.stat()
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def ordered_imap(pool: Executor, fn, items, depth: int):
+    """
+    Maps fn over items with a bounded number of pending tasks, results are yielded in input order
+
+    Args:
+        pool: executor running the tasks
+        fn: picklable function
+        items: iterable of task arguments
+        depth: max number of submitted but not yet yielded tasks
+
+    Returns:
+        generator of (item, result)
+    """
+    pending = deque()
+    for item in items:
+        pending.append((item, pool.submit(fn, item)))
+        if len(pending) >= depth:
+            item, future = pending.popleft()
+            yield item, future.result()
+    while pending:
+        item, future = pending.popleft()
+        yield item, future.result()
+
+
+def load_state(path: Path, version: int, **expected) -> dict:
+    """
+    Reads a JSON state file (manifest, cache) written by save_state
+
+    Args:
+        path: state file
+        version: expected format version
+        expected: further fields that must match, e.g. options the state depends on
+
+    Returns:
+        stored data, empty if the file does not exist, is unreadable or was written with another version or fields
+    """
+    if not path.exists():
+        return {}
+    try:
+        with open(path.as_posix(), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError('not a JSON object')
+    except (OSError, ValueError):
+        print(f'Ignoring unreadable file: {path}')
+        return {}
+    if data.get('version') != version or any(data.get(key) != value for key, value in expected.items()):
+        return {}
+    return data
+
+
+def save_state(path: Path, version: int, **data) -> None:
+    """
+    Writes a JSON state file atomically, an interrupted run keeps the previous file
+
+    Args:
+        path: state file
+        version: format version
+        data: top level fields
+    """
+    temp = path.with_name(path.name + '.tmp')
+    with open(temp.as_posix(), 'w', encoding='utf-8') as f:
+        json.dump({'version': version, **data}, f)
+    os.replace(temp.as_posix(), path.as_posix())
@@ -1,9 +1,15 @@
+import re
 from pathlib import Path
 from datetime import datetime
+from typing import TYPE_CHECKING
 
-from bs4 import BeautifulSoup
+import numpy
+from lxml import etree
 
-from tesspage.document import Document, Page, TextRegion, TextLine, page_to_string
+from tesspage.document import Document, Page, TextRegion, TextLine, pack_coords, page_to_string
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
 
 
 class HOCRParser:
@@ -11,18 +17,20 @@ class HOCRParser:
         self.fp = path
         self.document: Document = self.__parse(self.__check_valid())
 
-    def __check_valid(self) -> BeautifulSoup:
+    def __check_valid(self) -> 'BeautifulSoup':
         """
         Check for valid HOCR file
 
         Returns:
             BeautifulSoup object
         """
+        from bs4 import BeautifulSoup  # only loaded for backend='bs4'
+
         with open(self.fp.as_posix(), 'r', encoding='utf-8') as f:
             data = f.read()
         return BeautifulSoup(data, 'html.parser')
 
-    def __parse(self, bs: BeautifulSoup) -> Document:
+    def __parse(self, bs: 'BeautifulSoup') -> Document:
         """
         Parsing BeautifulSoup object to Document object
 
@@ -72,6 +80,7 @@ class HOCRParser:
                 except AttributeError:
                     print(f'\tError in TextRegion: {region["id"]}')
                     continue  # ignore region on missing data
+            pack_coords(p)
             doc.pages.append(p)
         return doc
 
@@ -98,29 +107,170 @@ class HOCRParser:
         return form
 
 
-def parse_hocr(path: Path) -> Document:
+BBOX_PATTERN = re.compile(r'bbox\s+(-?\d+)\s+(-?\d+)\s+(-?\d+)\s+(-?\d+)')
+IMAGE_PATTERN = re.compile(r'image\s+"?([^";]*)"?')
+WCONF_PATTERN = re.compile(r'x_wconf\s+(-?[\d.]+)')
+
+
+class HOCRLxmlParser:
+    def __init__(self, path: Path, data: bytes = None):
+        self.fp = path
+        self.document: Document = self.__parse(self.__check_valid(data))
+
+    def __check_valid(self, data: bytes = None):
+        """
+        Check for valid HOCR file
+
+        Args:
+            data: in-memory hOCR, file is read if None
+
+        Returns:
+            lxml root element
+        """
+        parser = etree.HTMLParser(encoding='utf-8', huge_tree=True)
+        if data is not None:
+            root = etree.fromstring(data, parser)
+            if root is None:
+                raise TypeError(self.fp.as_posix() + 'contains no hOCR data!')
+            return root
+        if not self.fp.exists():
+            raise FileNotFoundError(self.fp.as_posix() + 'does not exist!')
+        return etree.parse(self.fp.as_posix(), parser).getroot()
+
+    def __parse(self, root) -> Document:
+        """
+        Parsing lxml tree to Document object, the tree is walked once and title attributes are decoded in bulk
+
+        Args:
+            root: lxml root element
+
+        Returns:
+            Document object
+        """
+        doc = Document(file=self.fp.as_posix(), id=self.fp.name.replace('hocr', ''))
+
+        creator = root.find('.//meta[@name="ocr-system"]')
+        if creator is not None:
+            doc.creator = creator.get('content')
+
+        doc.created = str(datetime.utcnow().isoformat(timespec="seconds"))  # maybe change to actual creation time
+        doc.last_change = str(datetime.utcnow().isoformat(timespec="seconds"))
+
+        # single pass: collect elements, their bbox strings and word confidences
+        elements = []  # (class, element, bbox index or None)
+        bboxes = []
+        words = {}  # line index in elements -> [word text]
+        confs = {}  # line index in elements -> [word confidence]
+        line, line_index = None, None  # current ocr_line element and its index in elements
+        for elem in root.iter('div', 'span'):
+            classes = (elem.get('class') or '').split()
+            if elem.tag == 'div' and ('ocr_page' in classes or 'ocr_carea' in classes):
+                cls = 'ocr_page' if 'ocr_page' in classes else 'ocr_carea'
+                line, line_index = None, None
+            elif elem.tag == 'span' and 'ocr_line' in classes:
+                cls = 'ocr_line'
+                line, line_index = elem, len(elements)
+                words[line_index], confs[line_index] = [], []
+            elif elem.tag == 'span' and 'ocrx_word' in classes:
+                # words outside of a line are dropped like by the bs4 backend, which searches words within lines
+                if line is not None and any(parent is line for parent in elem.iterancestors('span')):
+                    words[line_index].append(''.join(elem.itertext()))
+                    conf = WCONF_PATTERN.search(elem.get('title') or '')
+                    if conf is not None:
+                        confs[line_index].append(conf.group(1))
+                continue
+            else:
+                continue
+            bbox = BBOX_PATTERN.search(elem.get('title') or '')
+            if bbox is None:
+                elements.append((cls, elem, None))
+            else:
+                elements.append((cls, elem, len(bboxes)))
+                bboxes.append(' '.join(bbox.groups()))
+
+        # bulk decode: bbox (x0 y0 x1 y1) to polygon [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+        boxes = numpy.array(' '.join(bboxes).split(), dtype=numpy.int32).reshape(-1, 4)
+        coords = boxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)  # shared buffer, items are views
+
+        p = None
+        r = None
+        for index, (cls, elem, bbox) in enumerate(elements):
+            if cls == 'ocr_page':
+                image = IMAGE_PATTERN.search(elem.get('title') or '')
+                p = Page(
+                    id=elem.get('id'),
+                    file=image.group(1) if image is not None else '',
+                    height=int(coords[bbox][2][1]) if bbox is not None else 0,
+                    width=int(coords[bbox][2][0]) if bbox is not None else 0,
+                )
+                doc.pages.append(p)
+                r = None
+            elif cls == 'ocr_carea':
+                if p is None or bbox is None:
+                    print(f'\tError in TextRegion: {elem.get("id")}')
+                    r = None
+                    continue  # ignore region on missing data
+                r = TextRegion(id=elem.get('id'), coords=coords[bbox])
+                p.text_regions.append(r)
+            elif r is not None:
+                if bbox is None:
+                    print(f'\tError in TextLine: {elem.get("id")}')
+                    continue  # ignore line on missing data
+                conf = numpy.array(confs[index], dtype=float)
+                r.text_lines.append(TextLine(
+                    id=elem.get('id'),
+                    text=' '.join(words[index]),
+                    coords=coords[bbox],
+                    conf=round(float(conf.mean()) / 100, 4) if conf.size else None,
+                ))
+        return doc
+
+
+HOCR_BACKENDS = {
+    'lxml': HOCRLxmlParser,
+    'bs4': HOCRParser,
+}
+
+
+def parse_hocr(path: Path, backend: str = 'lxml') -> Document:
     """
     Parse HOCR file to Document object
 
     Args:
         path: absolute .hocr file path
+        backend: 'lxml' or 'bs4' (BeautifulSoup)
+
+    Returns:
+        Document object
+    """
+    return HOCR_BACKENDS[backend](path).document
+
+
+def parse_hocr_data(data: bytes, path: Path) -> Document:
+    """
+    Parse in-memory hOCR (e.g. tesseract stdout) to Document object
+
+    Args:
+        data: hOCR document
+        path: file name the Document object refers to
 
     Returns:
         Document object
     """
-    return HOCRParser(path).document
+    return HOCRLxmlParser(path, data).document
 
 
-def hocr_to_string(path: Path) -> str:
+def hocr_to_string(path: Path, backend: str = 'lxml') -> str:
     """
     Parsing PageXML file to single string
 
     Args:
         path: path to PageXML file
+        backend: 'lxml' or 'bs4' (BeautifulSoup)
 
     Returns:
         formatted string (separators for page \\n\\n\\n, regions \\n\\n, lines \\n)
 
     """
-    doc = parse_hocr(path)
+    doc = parse_hocr(path, backend)
     return '\n\n\n'.join([page_to_string(page) for page in doc.pages])
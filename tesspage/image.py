@@ -0,0 +1,176 @@
+import threading
+from collections import Counter, OrderedDict
+
+import cv2
+import numpy
+
+from tesspage.metrics import stage
+
+
+class ImageCache:
+    def __init__(self, max_bytes: int = 1 << 30, grayscale: bool = False):
+        """
+        Cache of decoded page images, keyed by file and page index of multi-page images.
+        Only images that another page of the current document will request again are kept, they are dropped with
+        their last request, so no decoded page outlives its document.
+
+        Args:
+            max_bytes: byte budget of all cached images, 0 disables caching
+            grayscale: decode single channel images
+        """
+        self.max_bytes = max_bytes
+        self.grayscale = grayscale
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.__images = OrderedDict()
+        self.__refs = Counter()  # (file, page index) -> requests left in the current document
+        self.__lock = threading.Lock()
+
+    def plan(self, pages: list) -> None:
+        """
+        Starts a document, drops images of the previous one
+
+        Args:
+            pages: Page objects of the document in request order
+        """
+        with self.__lock:
+            self.__images.clear()
+            self.size = 0
+            self.__refs = Counter((page.file, page.image_index) for page in pages)
+
+    def get(self, file: str, page_index: int = 0) -> numpy.ndarray:
+        """
+        Decoded page image
+
+        Args:
+            file: image file
+            page_index: page of a multi-page image (TIFF)
+
+        Returns:
+            image array, None if the file can not be decoded
+        """
+        key = (file, page_index)
+        with self.__lock:
+            self.__refs[key] -= 1
+            keep = self.__refs[key] > 0
+            img = self.__images.get(key) if keep else self.__images.pop(key, None)
+            if img is not None:
+                if not keep:
+                    self.size -= img.nbytes
+                self.hits += 1
+                return img
+            self.misses += 1
+
+        with stage('decode'):
+            img = decode_image(file, page_index, self.grayscale)  # outside of lock, cv2 releases the GIL
+        if img is None or not keep or img.nbytes > self.max_bytes:
+            return img  # not requested again or too large for the budget, not cached
+
+        with self.__lock:
+            if key not in self.__images:
+                self.__images[key] = img
+                self.size += img.nbytes
+            while self.size > self.max_bytes:
+                _, old = self.__images.popitem(last=False)
+                self.size -= old.nbytes
+        return img
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__images.clear()
+            self.__refs.clear()
+            self.size = 0
+
+
+def decode_image(file: str, page_index: int = 0, grayscale: bool = False):
+    """
+    Decodes a single page of an image file
+
+    Args:
+        file: image file
+        page_index: page of a multi-page image (TIFF)
+        grayscale: decode single channel image instead of BGR
+
+    Returns:
+        image array, None if the file can not be decoded
+    """
+    flags = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+    if page_index == 0:
+        return cv2.imread(file, flags)
+    ok, pages = cv2.imreadmulti(file, page_index, 1, flags=flags)  # decodes only the requested page
+    return pages[0] if ok and len(pages) else None
+
+
+_cache = None  # ImageCache of the current process
+
+
+def image_cache(max_bytes: int, grayscale: bool) -> ImageCache:
+    """
+    Process wide ImageCache, recreated if the settings change
+
+    Args:
+        max_bytes: byte budget of all cached images
+        grayscale: decode single channel images
+
+    Returns:
+        ImageCache object
+    """
+    global _cache
+    if _cache is None or _cache.max_bytes != max_bytes or _cache.grayscale != grayscale:
+        _cache = ImageCache(max_bytes, grayscale)
+    return _cache
+
+
+class LineNormalizer:
+    def __init__(self, img: numpy.ndarray, height: int, binarize: bool = False):
+        """
+        Normalizes line crops of a page: contrast (or Otsu binarization), trimmed to the ink, scaled to a fixed height.
+        Grayscale conversion, page statistics and the intensity mapping run once on the whole page,
+        lines are cropped from the normalized page.
+
+        Args:
+            img: page image (BGR or grayscale)
+            height: height of the normalized line images including padding
+            binarize: write black and white lines instead of contrast stretched grayscale
+        """
+        self.height = height
+        self.binarize = binarize
+        self.padding = max(height // 8, 1)  # white border around the ink, tesseract needs a small margin
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        self.threshold, _ = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        levels = numpy.arange(256, dtype=numpy.float32)
+        if binarize:
+            lut = numpy.where(levels > self.threshold, 255, 0)
+        else:
+            cumulative = numpy.cumsum(cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel())
+            low, high = numpy.searchsorted(cumulative, cumulative[-1] * numpy.array((0.01, 0.99)))  # 1%, 99% levels
+            high = max(high, low + 1)
+            lut = numpy.clip((levels - low) * (255 / (high - low)), 0, 255)
+            self.threshold = numpy.clip((self.threshold - low) * (255 / (high - low)), 0, 255)
+        self.page = cv2.LUT(gray, lut.astype(numpy.uint8))
+
+    def normalize(self, cropped: numpy.ndarray) -> numpy.ndarray:
+        """
+        Trims and scales a line cropped from self.page
+
+        Args:
+            cropped: line image of the normalized page
+
+        Returns:
+            new single channel image of self.height pixels
+        """
+        ink = cropped < self.threshold
+        rows, cols = numpy.flatnonzero(ink.any(axis=1)), numpy.flatnonzero(ink.any(axis=0))
+        if rows.size:
+            cropped = cropped[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]  # trim whitespace
+
+        h, w = cropped.shape
+        inner = max(self.height - 2 * self.padding, 1)
+        width = max(round(w * inner / h), 1)
+        interpolation = cv2.INTER_AREA if inner < h else cv2.INTER_LINEAR
+        line = cv2.resize(cropped, (width, inner), interpolation=interpolation)
+        if self.binarize:
+            line = cv2.threshold(line, 127, 255, cv2.THRESH_BINARY)[1]  # interpolation adds gray levels
+        return cv2.copyMakeBorder(line, self.padding, self.height - inner - self.padding, self.padding, self.padding,
+                                  cv2.BORDER_CONSTANT, value=255)
@@ -0,0 +1,184 @@
+from pathlib import Path
+
+from tesspage.helper import file_hash, file_stat, load_state, save_state
+from tesspage.shard import complete_parts, shard_path
+
+
+class GTManifest:
+    FILE = '.tesspage_manifest.json'
+    VERSION = 1
+    SUFFIXES = ('.png', '.gt.txt')  # files written per line
+
+    def __init__(self, output_dir: Path, shard: tuple = None, options: dict = None):
+        """
+        Hashes of generated documents and their lines
+
+        Args:
+            output_dir: ground truth folder
+            shard: (i, N) of a sharded run, uses a manifest per shard, which starts from the merged manifest
+            options: generate options the written lines depend on, a manifest recorded with other options is
+                discarded, so every document is generated again. None keeps the recorded options.
+        """
+        self.output_dir = output_dir
+        self.path = shard_path(output_dir.joinpath(self.FILE), shard)
+        self.__hashes = {}
+        # PageXML file -> {'xml': hash, 'images': {image: hash}, 'lines': [base name], 'stats': {file: [mtime, size]}}
+        self.documents, self.options = self.load(self.path, options)
+        if shard is not None and not self.path.exists():
+            self.documents, self.options = self.load(output_dir.joinpath(self.FILE), options)
+
+    @classmethod
+    def load(cls, path: Path, options: dict = None) -> tuple:
+        """
+        Reads documents and options of a manifest file
+
+        Args:
+            path: manifest file
+            options: expected options, None accepts any
+
+        Returns:
+            (documents dict, options dict), documents are empty if the file does not exist, is unreadable or was
+            recorded with other options
+        """
+        if options is None:
+            state = load_state(path, cls.VERSION)
+            return state.get('documents', {}), state.get('options')
+        return load_state(path, cls.VERSION, options=options).get('documents', {}), options
+
+    def __same(self, file: Path, digest: str, stats: dict) -> bool:
+        """
+        Compares a file with its recorded hash, files with recorded mtime and size are not read
+
+        Args:
+            file: PageXML or image file
+            digest: recorded hash
+            stats: recorded {file: [mtime, size]} of the document, updated for touched files with unchanged content
+        """
+        stat = file_stat(file)
+        if stat is not None and stats.get(file.as_posix()) == stat:
+            return True
+        if self.__hash(file) != digest:
+            return False
+        stats[file.as_posix()] = stat
+        return True
+
+    def __hash(self, file: Path):
+        """
+        Content hash, cached for the current run
+
+        Returns:
+            sha256 hex digest, None if file does not exist
+        """
+        key = file.as_posix()
+        if key not in self.__hashes:
+            self.__hashes[key] = file_hash(file) if file.is_file() else None
+        return self.__hashes[key]
+
+    def unchanged(self, file: Path) -> bool:
+        """
+        Check if PageXML file, its images and all produced lines are unchanged since the last run.
+        Files are only hashed if their mtime or size differs from the last run.
+
+        Args:
+            file: PageXML file
+
+        Returns:
+            True if the document can be skipped
+        """
+        entry = self.documents.get(file.as_posix())
+        if entry is None:
+            return False
+        stats = entry.setdefault('stats', {})
+        if not self.__same(file, entry['xml'], stats):
+            return False
+        if not all(self.__same(Path(image), h, stats) for image, h in entry['images'].items()):
+            return False
+        return all(self.output_dir.joinpath(line + self.SUFFIXES[0]).exists() for line in entry['lines'])
+
+    def update(self, file: Path, images: list, lines: list) -> int:
+        """
+        Records a generated document, lines of the previous run that were not generated again are removed
+
+        Args:
+            file: PageXML file
+            images: page image files
+            lines: base names of generated lines
+
+        Returns:
+            number of removed lines
+        """
+        old = self.documents.get(file.as_posix(), {}).get('lines', [])
+        self.documents[file.as_posix()] = {
+            'xml': self.__hash(file),
+            'images': {image: self.__hash(Path(image)) for image in images},
+            'lines': lines,
+            'stats': {f.as_posix(): file_stat(f) for f in [file] + [Path(image) for image in images]},
+        }
+        return self.__remove(set(old) - set(lines))
+
+    def prune(self, files: list) -> int:
+        """
+        Removes documents that are no longer part of the input, including their lines
+
+        Args:
+            files: current PageXML files
+
+        Returns:
+            number of removed lines
+        """
+        current = {file.as_posix() for file in files}
+        stale = [key for key in self.documents if key not in current]
+        return sum(self.__remove(set(self.documents.pop(key)['lines'])) for key in stale)
+
+    def keep(self, files: list) -> None:
+        """
+        Forgets documents of other shards, their lines are kept
+
+        Args:
+            files: PageXML files of this shard
+        """
+        current = {file.as_posix() for file in files}
+        self.documents = {key: entry for key, entry in self.documents.items() if key in current}
+
+    def forget(self, lines: set) -> None:
+        """
+        Drops deleted lines from their documents, so the documents stay unchanged
+
+        Args:
+            lines: base names of deleted lines
+        """
+        for entry in self.documents.values():
+            entry['lines'] = [line for line in entry['lines'] if line not in lines]
+
+    def __remove(self, lines: set) -> int:
+        for line in lines:
+            for suffix in self.SUFFIXES:
+                self.output_dir.joinpath(line + suffix).unlink(missing_ok=True)
+        return len(lines)
+
+    def save(self) -> None:
+        """
+        Writes manifest atomically
+        """
+        save_state(self.path, self.VERSION, options=self.options, documents=self.documents)
+
+
+def merge_manifests(output_dir: Path):
+    """
+    Combines the manifests of all shards of the latest sharded run into the manifest of output_dir
+
+    Args:
+        output_dir: ground truth folder
+
+    Returns:
+        number of documents, None if there is no complete set of shard manifests
+    """
+    parts = complete_parts(output_dir.joinpath(GTManifest.FILE))
+    if not parts:
+        return None
+    manifest = GTManifest(output_dir)
+    manifest.documents, manifest.options = GTManifest.load(parts[0])
+    for part in parts[1:]:  # documents of shards run with other options are dropped
+        manifest.documents.update(GTManifest.load(part, manifest.options)[0])
+    manifest.save()
+    return len(manifest.documents)
@@ -0,0 +1,185 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from tesspage.shard import complete_parts
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process and its finished subprocesses (tesseract CLI, pool workers)
+
+    Returns:
+        peak RSS in MB, 0 if not supported by the platform
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return rss / (1 << 20) if sys.platform == 'darwin' else rss / 1024  # bytes on macOS, KiB on Linux
+
+
+class Metrics:
+    def __init__(self):
+        """
+        Wall time, CPU time and item counts per stage. Stages may be recorded from several threads.
+        """
+        self.stages = {}  # name -> [calls, items, wall seconds, cpu seconds]
+        self.documents = []  # [name, wall seconds, items] per document or file pair
+        self.worker_rss_mb = 0.0
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, items: int = 1):
+        """
+        Records wall and CPU time of the calling thread for a block
+
+        Args:
+            name: stage name
+            items: number of processed items (lines, pages, files)
+        """
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(name, items, time.perf_counter() - wall, time.thread_time() - cpu)
+
+    def add(self, name: str, items: int, wall: float, cpu: float, calls: int = 1) -> None:
+        with self.__lock:
+            values = self.stages.setdefault(name, [0, 0, 0.0, 0.0])
+            values[0] += calls
+            values[1] += items
+            values[2] += wall
+            values[3] += cpu
+
+    def document(self, name: str, seconds: float, items: int) -> None:
+        with self.__lock:
+            self.documents.append([name, seconds, items])
+
+    def snapshot(self) -> dict:
+        """
+        Picklable state, sent from worker processes to the main process
+        """
+        with self.__lock:
+            return {
+                'stages': {name: list(values) for name, values in self.stages.items()},
+                'documents': [list(doc) for doc in self.documents],
+                'worker_rss_mb': max(self.worker_rss_mb, peak_rss_mb()),
+            }
+
+    def merge(self, snapshot: dict, document: str = None, items: int = 0) -> None:
+        """
+        Adds a snapshot of another process or task
+
+        Args:
+            snapshot: result of snapshot() or measured()
+            document: record the task as document with this name
+            items: number of items of the document
+        """
+        for name, (calls, stage_items, wall, cpu) in snapshot['stages'].items():
+            self.add(name, stage_items, wall, cpu, calls)
+        with self.__lock:
+            self.documents.extend(snapshot['documents'])
+            self.worker_rss_mb = max(self.worker_rss_mb, snapshot['worker_rss_mb'])
+        if document is not None:
+            self.document(document, snapshot['seconds'], items)
+
+    def export(self, target_file: Path, **info) -> None:
+        """
+        Writes metrics as json, documents are sorted by wall time (slowest first)
+
+        Args:
+            target_file: .json file
+            info: additional top level values (command, arguments, total time)
+        """
+        with self.__lock:
+            stages = {name: {
+                'calls': calls,
+                'items': items,
+                'wall_seconds': wall,
+                'cpu_seconds': cpu,
+                'items_per_second': items / wall if wall else None,
+            } for name, (calls, items, wall, cpu) in self.stages.items()}
+            documents = [{'name': name, 'wall_seconds': seconds, 'items': items}
+                         for name, seconds, items in sorted(self.documents, key=lambda x: -x[1])]
+            data = dict(info, stages=stages, documents=documents,
+                        peak_rss_mb=peak_rss_mb(), peak_worker_rss_mb=self.worker_rss_mb)
+        os.makedirs(target_file.parent.as_posix(), exist_ok=True)
+        with open(target_file.as_posix(), 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+
+
+_metrics = Metrics()  # collector of the current process, swapped per task by measured()
+
+
+def metrics() -> Metrics:
+    return _metrics
+
+
+def stage(name: str, items: int = 1):
+    """
+    Records a stage in the current collector, see Metrics.stage
+    """
+    return _metrics.stage(name, items)
+
+
+def measured(fn, task):
+    """
+    Runs a task with a separate collector, used as process pool entry point with functools.partial
+
+    Args:
+        fn: task function
+        task: task argument
+
+    Returns:
+        (result of fn, metrics snapshot with 'seconds' of the task)
+    """
+    global _metrics
+    outer, _metrics = _metrics, Metrics()
+    start = time.perf_counter()
+    try:
+        result = fn(task)
+    finally:
+        snapshot = dict(_metrics.snapshot(), seconds=time.perf_counter() - start)
+        _metrics = outer
+    return result, snapshot
+
+
+def merge_metrics(target_file: Path):
+    """
+    Combines the metrics files of all shards of the latest sharded run into target_file.
+    Stage values are summed, wall time and peak memory are the maxima of the shards.
+
+    Args:
+        target_file: metrics file of an unsharded run
+
+    Returns:
+        number of merged shards, None if there is no complete set of shard metrics
+    """
+    parts = complete_parts(target_file)
+    if not parts:
+        return None
+    merged = {'shards': len(parts), 'stages': {}, 'documents': []}
+    for part in parts:
+        with open(part.as_posix(), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for key in ('command', 'jobs'):
+            merged.setdefault(key, data.get(key))
+        for key in ('wall_seconds', 'peak_rss_mb', 'peak_worker_rss_mb'):
+            merged[key] = max(merged.get(key, 0), data.get(key, 0))
+        for name, values in data['stages'].items():
+            total = merged['stages'].setdefault(name, {'calls': 0, 'items': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+            for key in total:
+                total[key] += values[key]
+        merged['documents'] += data['documents']
+    for values in merged['stages'].values():
+        values['items_per_second'] = values['items'] / values['wall_seconds'] if values['wall_seconds'] else None
+    merged['documents'].sort(key=lambda doc: -doc['wall_seconds'])
+    with open(target_file.as_posix(), 'w', encoding='utf-8') as f:
+        json.dump(merged, f, indent=2)
+    return len(parts)
@@ -0,0 +1,217 @@
+import importlib.util
+import os
+import shlex
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+from tesspage.helper import ordered_imap
+from tesspage.metrics import measured, metrics, stage
+
+# optional: keeps the model loaded inside the worker, imported by the worker after OMP_THREAD_LIMIT is set
+HAS_TESSEROCR = importlib.util.find_spec('tesserocr') is not None
+
+
+API_RENDERERS = {
+    'txt': ('GetUTF8Text', '.txt'),
+    'hocr': ('GetHOCRText', '.hocr'),
+}
+
+HOCR_HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN"\n'
+               '    "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">\n'
+               '<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en">\n <head>\n  <title></title>\n'
+               '  <meta http-equiv="Content-Type" content="text/html;charset=utf-8"/>\n'
+               '  <meta name=\'ocr-system\' content=\'tesseract {version}\' />\n'
+               '  <meta name=\'ocr-capabilities\' content=\'ocr_page ocr_carea ocr_par ocr_line ocrx_word\'/>\n'
+               ' </head>\n <body>\n')
+HOCR_FOOTER = ' </body>\n</html>\n'
+
+
+def cli_fallback(config: str, args: str):
+    """
+    Reason why workers run the tesseract CLI once per image instead of keeping the model loaded
+
+    Args:
+        config: output config
+        args: custom args
+
+    Returns:
+        reason string, None if the tesserocr API is used
+    """
+    if not HAS_TESSEROCR:
+        return 'tesserocr is not installed'
+    if args:
+        return 'custom ARGS are given'
+    if config.lower() not in API_RENDERERS and config.lower() != 'pagexml':
+        return f'config {config} is not supported by the API'
+    return None
+
+
+class TesseractWorker:
+    def __init__(self, data_dir: Path, model_name: str, config_dir: Path, config: str, args: str):
+        self.data_dir = data_dir
+        self.model_name = model_name
+        self.config_dir = config_dir
+        self.config = config.lower()
+        self.args = args
+        self.api = None
+
+    def load(self) -> None:
+        """
+        Loads the model into a tesseract API instance if tesserocr is installed and no custom args are given.
+        The API renders txt and hocr itself, config files of config_dir are not read.
+        """
+        if HAS_TESSEROCR and not self.args:
+            import tesserocr
+            self.api = tesserocr.PyTessBaseAPI(path=self.data_dir.as_posix(), lang=self.model_name)
+
+    def ocr(self, image: Path, output_base: Path, config: str) -> None:
+        """
+        Run Tesseract on a single image, creates file <output_base>.<config>
+
+        Args:
+            image: image file
+            output_base: output_dir + filename without extension
+            config: output config (txt, hocr, ...)
+        """
+        if self.api is not None and config in API_RENDERERS:
+            method, suffix = API_RENDERERS[config]
+            with stage('ocr'):
+                self.api.SetImageFile(image.as_posix())
+                data = self.__hocr() if config == 'hocr' else getattr(self.api, method)()
+            with open(output_base.as_posix() + suffix, 'w', encoding='utf-8') as f:
+                f.write(data)
+        else:
+            with stage('ocr'):
+                self.__cli(image, output_base.as_posix(), config)
+
+    def hocr(self, image: Path) -> bytes:
+        """
+        Run Tesseract on a single image without writing files
+
+        Args:
+            image: image file
+
+        Returns:
+            hOCR document
+        """
+        with stage('ocr'):
+            if self.api is not None:
+                self.api.SetImageFile(image.as_posix())
+                return self.__hocr().encode('utf-8')
+            return self.__cli(image, '-', 'hocr')  # '-' writes to stdout
+
+    def __hocr(self) -> str:
+        """
+        Complete hOCR document of the current API image
+        """
+        import tesserocr
+        return (HOCR_HEADER.format(version=tesserocr.tesseract_version().split()[1]) +
+                self.api.GetHOCRText(0) + HOCR_FOOTER)
+
+    def __cli(self, image: Path, output_base: str, config: str) -> bytes:
+        """
+        Run Tesseract CLI
+
+        Args:
+            image: image file
+            output_base: output_dir + filename without extension, '-' for stdout
+            config: output config (txt, hocr, ...)
+
+        Returns:
+            stdout of tesseract
+        """
+        cmd = ['tesseract', image.as_posix(), output_base, '--tessdata-dir', self.data_dir.as_posix(),
+               '-l', self.model_name, self.config_dir.joinpath(config).as_posix()] + shlex.split(self.args)
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            error = result.stderr.decode('utf-8', errors='replace').strip()
+            raise RuntimeError(error.splitlines()[-1] if error else f'tesseract exited with {result.returncode}')
+        return result.stdout
+
+    def run(self, image: Path, output_dir: Path) -> None:
+        """
+        Run Tesseract on a single image, pagexml config is built in memory from hocr output
+
+        Args:
+            image: image file
+            output_dir: folder for file output
+        """
+        stem = os.path.splitext(image.name)[0]
+        if self.config != 'pagexml':
+            self.ocr(image, output_dir.joinpath(stem), self.config)
+            return
+
+        from tesspage.hocr_parser import parse_hocr_data
+        from tesspage.pagexml_builder import build_xml_file
+        data = self.hocr(image)
+        with stage('hocr_parse'):
+            document = parse_hocr_data(data, output_dir.joinpath(stem + '.hocr'))
+        with stage('pagexml_build'):
+            build_xml_file(data=document, target_file=output_dir.joinpath(stem + '.xml'))
+
+
+_worker = None  # TesseractWorker of the current process
+
+
+def _init_worker(data_dir: Path, model_name: str, config_dir: Path, config: str, args: str) -> None:
+    """
+    Process pool initializer: one OpenMP thread per worker, model is loaded once
+    """
+    global _worker
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+    _worker = TesseractWorker(data_dir, model_name, config_dir, config, args)
+    _worker.load()
+
+
+def _run_task(task: tuple):
+    """
+    Process pool entry point
+
+    Args:
+        task: (image, output_dir)
+
+    Returns:
+        None on success, error message on failure
+    """
+    try:
+        _worker.run(*task)
+    except Exception as e:
+        return f'{type(e).__name__}: {e}'
+    return None
+
+
+class TesseractPool:
+    def __init__(self, data_dir: Path, model_name: str, config_dir: Path, config: str, args: str, jobs: int):
+        self.jobs = jobs
+        self.__pool = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                          initargs=(data_dir, model_name, config_dir, config, args))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.__pool.shutdown()
+
+    def run(self, images: list, output_dir: Path):
+        """
+        Run Tesseract on queued images, a failing image does not stop the batch.
+        Stage metrics of the workers are merged into the metrics of the calling process.
+
+        Args:
+            images: list of image files
+            output_dir: folder for file output
+
+        Returns:
+            generator of (image, error message or None) in input order
+        """
+        tasks = ((image, output_dir) for image in images)
+        for (image, _), (error, snapshot) in ordered_imap(self.__pool, partial(measured, _run_task), tasks,
+                                                         depth=4 * self.jobs):
+            metrics().merge(snapshot, document=image.name, items=1)
+            yield image, error
@@ -2,75 +2,105 @@ from pathlib import Path
 
 from lxml import etree
 
-from tesspage.document import Document
+from tesspage.coords import format_points
+from tesspage.document import Document, Page
 
 
-class PageXMLBuilder:
-    def __init__(self, document: Document):
-        self.doc = document
+PAGE_XMLNS = 'http://schema.primaresearch.org/PAGE/gts/pagecontent/2019-07-15'
+INDENT = '  '
 
-    def build(self, target_file: Path) -> None:
+
+class PageXMLWriter:
+    def __init__(self, target_file: Path, creator: str = '', created: str = '', last_change: str = ''):
         """
-        Writes Document object to file
+        Streams PageXML to a file page by page, only a single region is held as element tree
 
         Args:
             target_file: filepath + name + .xml
+            creator: Metadata/Creator, omitted if empty
+            created: Metadata/Created, omitted if empty
+            last_change: Metadata/LastChange, omitted if empty
         """
-        root = etree.Element('PcGts', xmlns="http://schema.primaresearch.org/PAGE/gts/pagecontent/2019-07-15")
+        self.page_counter = 0
+        self.__file = open(target_file.as_posix(), 'wb')
+        self.__xmlfile = etree.xmlfile(self.__file, encoding='UTF-8')
+        self.__xf = self.__xmlfile.__enter__()
+        self.__xf.write_declaration()
+        self.__root = self.__xf.element('PcGts', xmlns=PAGE_XMLNS)
+        self.__root.__enter__()
+
         metadata = etree.Element('Metadata')
-        if self.doc.creator != '':
-            creator = etree.Element('Creator')
-            creator.text = self.doc.creator
-            metadata.append(creator)
-        if self.doc.created != '':
-            created = etree.Element('Created')
-            created.text = self.doc.created
-            metadata.append(created)
-        if self.doc.last_change != '':
-            last_change = etree.Element('LastChange')
-            last_change.text = self.doc.last_change
-            metadata.append(last_change)
-
-        root.append(metadata)
-
-        for p in self.doc.pages:
-            page = etree.Element('Page', imageFilename=Path(p.file).name, imageHeight=str(p.height), imageWidth=str(p.width))
+        for tag, text in (('Creator', creator), ('Created', created), ('LastChange', last_change)):
+            if text != '':
+                etree.SubElement(metadata, tag).text = text
+        self.__write(metadata, level=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __write(self, elem, level: int) -> None:
+        """
+        Writes a pretty printed subtree at the given indentation level
+        """
+        etree.indent(elem, space=INDENT, level=level)
+        self.__xf.write('\n' + INDENT * level, elem)
+
+    def write_page(self, p: Page) -> None:
+        """
+        Writes a single page
+
+        Args:
+            p: Page object
+        """
+        attrs = {'imageFilename': Path(p.file).name, 'imageHeight': str(p.height), 'imageWidth': str(p.width)}
+        self.page_counter += 1
+        if not p.text_regions:
+            self.__write(etree.Element('Page', attrs), level=1)
+            return
+
+        self.__xf.write('\n' + INDENT)
+        with self.__xf.element('Page', attrs):
             for r in p.text_regions:
                 region = etree.Element('TextRegion', id=r.id)
-                region.append(etree.Element('Coords', points=self.__coords_formatter(r.coords)))
+                etree.SubElement(region, 'Coords', points=format_points(r.coords))
                 for l in r.text_lines:
-                    line = etree.Element('TextLine', id=l.id)
-                    line.append(etree.Element('Coords', points=self.__coords_formatter(l.coords)))
-                    # unicode tag
-                    unicode = etree.Element('Unicode')
-                    unicode.text = l.text
-
-                    # textequiv tag
-                    textequiv = etree.Element('TextEquiv', index='0')
-                    textequiv.append(unicode)
+                    line = etree.SubElement(region, 'TextLine', id=l.id)
+                    etree.SubElement(line, 'Coords', points=format_points(l.coords))
+                    textequiv = etree.SubElement(line, 'TextEquiv', index='0')
+                    if l.conf is not None:
+                        textequiv.set('conf', str(l.conf))
+                    etree.SubElement(textequiv, 'Unicode').text = l.text
+                self.__write(region, level=2)
+            self.__xf.write('\n' + INDENT)
+        self.__xf.flush()
+
+    def close(self) -> None:
+        if self.__file.closed:
+            return
+        self.__xf.write('\n')
+        self.__root.__exit__(None, None, None)
+        self.__xmlfile.__exit__(None, None, None)
+        self.__file.write(b'\n')
+        self.__file.close()
 
-                    line.append(textequiv)
-                    region.append(line)
-                page.append(region)
-            root.append(page)
 
-        with open(target_file.as_posix(), 'w') as f:
-            f.write(etree.tostring(root, pretty_print=True).decode('UTF-8'))
+class PageXMLBuilder:
+    def __init__(self, document: Document):
+        self.doc = document
 
-    def __coords_formatter(self, coords: list) -> str:
+    def build(self, target_file: Path) -> None:
         """
-        Format coords list to matching string
+        Writes Document object to file
 
         Args:
-            coords: nested coords list [[x0, y0],...]
-
-        Returns:
-            coords string
+            target_file: filepath + name + .xml
         """
-        c = []
-        for xy in coords:
-            c.append(f'{xy[0]},{xy[1]}')
-        return ' '.join(c)
+        with PageXMLWriter(target_file, self.doc.creator, self.doc.created, self.doc.last_change) as writer:
+            for p in self.doc.pages:
+                writer.write_page(p)
 
 
 def build_xml_file(data: Document, target_file: Path) -> None:
@@ -1,8 +1,13 @@
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from bs4 import BeautifulSoup
+from lxml import etree
 
-from tesspage.document import Document, Page, TextRegion, TextLine, page_to_string
+from tesspage.coords import CoordsError, parse_points
+from tesspage.document import Document, Page, TextRegion, TextLine, pack_coords, page_to_string
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
 
 
 class PageXMLParser:
@@ -10,7 +15,7 @@ class PageXMLParser:
         self.fp = path
         self.document: Document = self.__parse(self.__check_valid())
 
-    def __check_valid(self) -> BeautifulSoup:
+    def __check_valid(self) -> 'BeautifulSoup':
         """
         Check for valid PageXML formatting
 
@@ -23,6 +28,8 @@ class PageXMLParser:
         if not self.fp.suffix != 'xml':
             raise TypeError(self.fp.as_posix() + 'is no .xml file!')
 
+        from bs4 import BeautifulSoup  # only loaded for backend='bs4'
+
         with open(self.fp.as_posix(), 'r', encoding='utf-8') as f:
             data = f.read()
         bs = BeautifulSoup(data, 'xml')
@@ -35,7 +42,7 @@ class PageXMLParser:
             raise TypeError(self.fp.as_posix() + 'is not a PageXML file!')
         return bs
 
-    def __parse(self, bs: BeautifulSoup) -> Document:
+    def __parse(self, bs: 'BeautifulSoup') -> Document:
         """
         Parsing BeautifulSoup object to Document object
 
@@ -68,57 +75,201 @@ class PageXMLParser:
                 height=int(page.attrs.get('imageHeight')),
                 width=int(page.attrs.get('imageWidth'))
             )
+            p.image_index = sum(1 for x in doc.pages if x.file == p.file)  # multi-page images
             for region in page.find_all('TextRegion'):
                 try:
                     r = TextRegion(
                         id=region.attrs.get('id'),
-                        coords=[[int(x) for x in y.split(',')] for y in
-                                region.find('Coords').attrs.get('points').split(' ')]
+                        coords=parse_points(region.find('Coords').attrs.get('points'))
                     )
                     for line in region.find_all('TextLine'):
                         try:
                             l = TextLine(
                                 id=line.attrs.get('id'),
                                 text=line.find('Unicode').text,
-                                coords=[[int(x) for x in tuples.split(',')] for tuples in
-                                        line.find('Coords').attrs.get('points').split(' ')],
+                                coords=parse_points(line.find('Coords').attrs.get('points')),
                             )
                             r.text_lines.append(l)
                         except AttributeError:
                             print(f'\tError in TextLine: {line.attrs.get("id")}')
                             continue  # ignore line on missing data
+                        except CoordsError as e:
+                            print(f'\tError in TextLine: {line.attrs.get("id")} ({e})')
+                            continue  # ignore line on bad coords
                     p.text_regions.append(r)
                 except AttributeError:
                     print(f'\tError in TextRegion: {region.attrs.get("id")}')
                     continue  # ignore region on missing data
+                except CoordsError as e:
+                    print(f'\tError in TextRegion: {region.attrs.get("id")} ({e})')
+                    continue  # ignore region on bad coords
+            pack_coords(p)
             doc.pages.append(p)
             page_counter += 1
         return doc
 
 
-def parse_pagexml(path: Path) -> Document:
+PAGE_NAMESPACE = 'http://schema.primaresearch.org/PAGE/gts/pagecontent/'
+
+
+class PageXMLStreamParser:
+    def __init__(self, path: Path):
+        self.fp = path
+        self.__check_valid()
+        self.document: Document = self.__parse()
+
+    def __check_valid(self) -> None:
+        """
+        Check for valid file, PageXML namespace is checked while parsing
+        """
+        if not self.fp.exists():
+            raise FileNotFoundError(self.fp.as_posix() + 'does not exist!')
+        if not self.fp.is_file():
+            raise IsADirectoryError(self.fp.as_posix() + 'is a directory!')
+
+    def __parse(self) -> Document:
+        """
+        Streams PageXML file to Document object, handled elements are cleared immediately.
+        Supports all PAGE schema versions.
+
+        Returns:
+            Document object
+        """
+        doc = Document(file=self.fp.as_posix(), id=self.fp.name.replace('.xml', ''))
+        ns = ''
+        page = None
+        regions = []  # stack of open regions: (TextRegion, [TextLine], [error messages])
+        page_counter = 0
+
+        for event, elem in etree.iterparse(self.fp.as_posix(), events=('start', 'end'), huge_tree=True):
+            if not ns:  # first event: root element
+                ns = etree.QName(elem).namespace or ''
+                if etree.QName(elem).localname != 'PcGts' or not ns.startswith(PAGE_NAMESPACE):
+                    raise TypeError(self.fp.as_posix() + 'is not a PageXML file!')
+                ns = f'{{{ns}}}'
+                continue
+
+            tag = elem.tag
+            if event == 'start':
+                if tag == ns + 'Page':
+                    page = Page(
+                        id=f'page_{page_counter}',
+                        file=self.fp.parent.joinpath(elem.get('imageFilename')).as_posix(),
+                        height=int(elem.get('imageHeight')),
+                        width=int(elem.get('imageWidth'))
+                    )
+                    page.image_index = sum(1 for p in doc.pages if p.file == page.file)  # multi-page images
+                    doc.pages.append(page)
+                    page_counter += 1
+                elif tag == ns + 'TextRegion':
+                    r = TextRegion(id=elem.get('id'))
+                    page.text_regions.append(r)
+                    regions.append((r, [], []))
+                continue
+
+            if tag == ns + 'TextLine':
+                if regions:
+                    try:
+                        coords = self.__coords(elem, ns)
+                        unicode = elem.find(f'{ns}TextEquiv/{ns}Unicode')
+                        if unicode is None:
+                            raise ValueError('missing TextEquiv/Unicode')
+                        regions[-1][1].append(TextLine(id=elem.get('id'), text=unicode.text or '', coords=coords))
+                    except ValueError as e:
+                        regions[-1][2].append(f'\tError in TextLine: {elem.get("id")} ({e})')  # ignore line
+                elem.clear()
+
+            elif tag == ns + 'TextRegion':
+                r, lines, errors = regions.pop()
+                try:
+                    coords = self.__coords(elem, ns)
+                except CoordsError as e:
+                    print(f'\tError in TextRegion: {r.id} ({e})')
+                    page.text_regions = [x for x in page.text_regions if x is not r]  # ignore region on bad data
+                else:
+                    r.coords = coords
+                    r.text_lines = lines
+                    for error in errors:
+                        print(error)
+                elem.clear()
+
+            elif tag == ns + 'Metadata':
+                doc.creator = elem.findtext(ns + 'Creator', default='')
+                doc.created = elem.findtext(ns + 'Created', default='')
+                doc.last_change = elem.findtext(ns + 'LastChange', default='')
+                elem.clear()
+
+            elif tag == ns + 'Page':
+                pack_coords(page)
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]  # drop handled siblings from root
+        return doc
+
+    @staticmethod
+    def __coords(elem, ns: str):
+        """
+        Reads points of direct Coords child
+
+        Args:
+            elem: region or line element
+            ns: namespace in clark notation
+
+        Returns:
+            int32 array of shape (n, 2)
+
+        Raises:
+            CoordsError: on missing or malformed points
+        """
+        points = elem.find(ns + 'Coords')
+        if points is None:
+            raise CoordsError('missing Coords')
+        return parse_points(points.get('points'))
+
+
+PARSER_BACKENDS = {
+    'lxml': PageXMLStreamParser,
+    'bs4': PageXMLParser,
+}
+
+
+def parser_backend(backend: str):
+    """
+    Parser class of a backend name
+
+    Raises:
+        ValueError: on unknown backends
+    """
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f'unknown PageXML backend {backend}, use one of {", ".join(PARSER_BACKENDS)}')
+    return PARSER_BACKENDS[backend]
+
+
+def parse_pagexml(path: Path, backend: str = 'lxml') -> Document:
     """
     Parse PageXML file to Document object
 
     Args:
         path: path to pagexml file
+        backend: 'lxml' (streaming) or 'bs4' (BeautifulSoup)
 
     Returns:
         Document object
     """
-    return PageXMLParser(path).document
+    return parser_backend(backend)(path).document
 
 
-def pagexml_to_string(path: Path) -> str:
+def pagexml_to_string(path: Path, backend: str = 'lxml') -> str:
     """
     Parsing PageXML file to single string
 
     Args:
         path: path to PageXML file
+        backend: 'lxml' (streaming) or 'bs4' (BeautifulSoup)
 
     Returns:
         formatted string (separators for page \\n\\n\\n, regions \\n\\n, lines \\n)
 
     """
-    doc = parse_pagexml(path)
+    doc = parse_pagexml(path, backend)
     return '\n\n\n'.join([page_to_string(page) for page in doc.pages])
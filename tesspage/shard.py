@@ -0,0 +1,111 @@
+import hashlib
+import re
+from pathlib import Path
+
+SHARD_PATTERN = re.compile(r'^(\d+)/(\d+)$')
+
+
+def parse_shard(spec: str) -> tuple:
+    """
+    Parses a shard spec
+
+    Args:
+        spec: 'i/N', zero based shard index i of N shards
+
+    Returns:
+        (i, N)
+    """
+    match = SHARD_PATTERN.match(spec.strip())
+    if match is None or not 0 <= int(match.group(1)) < int(match.group(2)):
+        raise ValueError(f'Invalid shard "{spec}", expected i/N with 0 <= i < N')
+    return int(match.group(1)), int(match.group(2))
+
+
+def shard_of(file: Path, root: Path, count: int) -> int:
+    """
+    Stable shard of a file, independent of the other files, the machine and the Python process
+
+    Args:
+        file: input file
+        root: input folder, the hash covers the path relative to it
+        count: number of shards
+
+    Returns:
+        shard index
+    """
+    rel = file.relative_to(root).as_posix() if file.is_relative_to(root) else file.name
+    return int.from_bytes(hashlib.sha256(rel.encode('utf-8')).digest()[:8], 'big') % count
+
+
+def select_shard(files: list, root: Path, shard: tuple) -> list:
+    """
+    Files of a single shard, input order is kept
+
+    Args:
+        files: sorted input files
+        root: input folder
+        shard: (i, N) or None for all files
+
+    Returns:
+        list of files
+    """
+    if shard is None:
+        return files
+    index, count = shard
+    return [file for file in files if shard_of(file, root, count) == index]
+
+
+def shard_path(path: Path, shard: tuple) -> Path:
+    """
+    Per shard variant of an output file (<stem>.shard-<i>-of-<N><suffix>)
+
+    Args:
+        path: output file of an unsharded run
+        shard: (i, N) or None
+
+    Returns:
+        path
+    """
+    if shard is None:
+        return path
+    return path.with_name(f'{path.stem}.shard-{shard[0]}-of-{shard[1]}{path.suffix}')
+
+
+def shard_parts(path: Path) -> dict:
+    """
+    Finds the per shard files of an output file
+
+    Args:
+        path: output file of an unsharded run
+
+    Returns:
+        {N: {i: path}} of existing files
+    """
+    pattern = re.compile(re.escape(path.stem) + r'\.shard-(\d+)-of-(\d+)' + re.escape(path.suffix) + '$')
+    parts = {}
+    for file in path.parent.glob(f'{path.stem}.shard-*-of-*{path.suffix}'):
+        match = pattern.match(file.name)
+        if match is not None:
+            parts.setdefault(int(match.group(2)), {})[int(match.group(1))] = file
+    return parts
+
+
+def complete_parts(path: Path) -> list:
+    """
+    Per shard files of the latest sharded run (shard count of the newest file), prints missing shards
+
+    Args:
+        path: output file of an unsharded run
+
+    Returns:
+        list of files ordered by shard index, empty if shards are missing
+    """
+    parts = shard_parts(path)
+    if not parts:
+        return []
+    count, files = max(parts.items(), key=lambda x: max(f.stat().st_mtime for f in x[1].values()))
+    missing = [str(i) for i in range(count) if i not in files]
+    if missing:
+        print(f'\t{path.name}: missing shard(s) {", ".join(missing)} of {count}')
+        return []
+    return [files[i] for i in range(count)]
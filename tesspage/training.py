@@ -0,0 +1,363 @@
+import json
+import math
+import os
+import random
+import re
+import signal
+import subprocess
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from tesspage.helper import file_hash, file_stat, load_state, ordered_imap, save_state
+
+LSTMF_CACHE = '.tesspage_lstmf.json'
+IMAGE_SUFFIXES = ('.png', '.bin.png', '.nrm.png', '.tif')  # lookup order of tesstrain
+
+# lstmtraining log lines, older versions write 'char train'/'word train' instead of BCER/BWER
+ITERATION_PATTERN = re.compile(r'At iteration (\d+)/(\d+)/(\d+), [Mm]ean rms=([\d.]+)%, delta=([\d.]+)%, '
+                               r'(?:BCER|char) train=([\d.]+)%, (?:BWER|word) train=([\d.]+)%, skip ratio=([\d.]+)%')
+BEST_PATTERN = re.compile(r'New best (?:BCER|char error) = ([\d.]+) wrote best model:(\S+)')
+EVAL_PATTERN = re.compile(r'At iteration (\d+), stage (\d+), Eval Char error rate=([\d.]+), Word error rate=([\d.]+)')
+FINISHED_PATTERN = re.compile(r'Finished! (?:Selected model with minimal training error rate \(BCER\)|Error rate) = ([\d.]+)')
+
+
+def line_box(text: str, width: int, height: int) -> str:
+    """
+    Box file of a single line image, same output as tesstrain generate_line_box.py
+
+    Args:
+        text: line text
+        width: image width
+        height: image height
+
+    Returns:
+        box file content, empty for an empty line
+    """
+    lines = text.strip().split('\n')
+    if len(lines) != 1:
+        raise ValueError(f'Ground truth text file should contain exactly one line, not {len(lines)}')
+    line = unicodedata.normalize('NFC', lines[0].strip())
+    if not line:
+        return ''
+
+    box = f' 0 0 {width} {height} 0\n'
+    rows = []
+    for prev_char, char in zip(line, line[1:]):
+        if unicodedata.combining(char):
+            rows.append(prev_char + char + box)
+        elif not unicodedata.combining(prev_char):
+            rows.append(prev_char + box)
+    if not unicodedata.combining(line[-1]):
+        rows.append(line[-1] + box)
+    rows.append('\t' + box)
+    return ''.join(rows)
+
+
+def line_image(gt_file: Path):
+    """
+    Image of a ground truth text file
+
+    Returns:
+        image file, None if missing
+    """
+    base = gt_file.as_posix()[:-len('.gt.txt')]
+    for suffix in IMAGE_SUFFIXES:
+        if os.path.isfile(base + suffix):
+            return Path(base + suffix)
+    return None
+
+
+def _init_worker() -> None:
+    os.environ['OMP_THREAD_LIMIT'] = '1'  # one tesseract thread per worker
+
+
+def lstmf_worker(task: tuple):
+    """
+    Process pool entry point, writes <base>.box and <base>.lstmf of a single line
+
+    Args:
+        task: (base path without extension, image file, page segmentation mode)
+
+    Returns:
+        None on success, error message on failure
+    """
+    import cv2
+
+    base, image, psm = task
+    try:
+        with open(base + '.gt.txt', 'r', encoding='utf-8') as f:
+            text = f.read()
+        img = cv2.imread(image.as_posix(), cv2.IMREAD_UNCHANGED)
+        if img is None:
+            raise ValueError(f'unreadable image {image.name}')
+        with open(base + '.box', 'w', encoding='utf-8') as f:
+            f.write(line_box(text, img.shape[1], img.shape[0]))
+
+        result = subprocess.run(['tesseract', image.as_posix(), base, '--psm', str(psm), 'lstm.train'],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0 or not os.path.isfile(base + '.lstmf'):
+            error = result.stderr.decode('utf-8', errors='replace').strip()
+            raise RuntimeError(error.splitlines()[-1] if error else f'tesseract exited with {result.returncode}')
+    except Exception as e:
+        return f'{type(e).__name__}: {e}'
+    return None
+
+
+class LstmfCache:
+    VERSION = 2
+
+    def __init__(self, ground_truth_dir: Path, psm: int):
+        """
+        Hashes, mtimes and sizes of line image and text for every prepared .lstmf file
+
+        Args:
+            ground_truth_dir: ground truth folder
+            psm: page segmentation mode, a different mode invalidates all entries
+        """
+        self.path = ground_truth_dir.joinpath(LSTMF_CACHE)
+        self.psm = psm
+        # base name -> [image hash, text hash, image [mtime, size], text [mtime, size]]
+        self.lines = load_state(self.path, self.VERSION, psm=psm).get('lines', {})
+
+    def save(self) -> None:
+        """
+        Writes cache atomically
+        """
+        save_state(self.path, self.VERSION, psm=self.psm, lines=self.lines)
+
+
+def write_lists(lstmf_files: list, output_dir: Path, ratio_train: float, seed: int) -> tuple:
+    """
+    Writes all-lstmf, list.train and list.eval like tesstrain (shuffled list, first ratio_train part for training)
+
+    Args:
+        lstmf_files: .lstmf files
+        output_dir: tesstrain output folder (<data_dir>/<model_name>)
+        ratio_train: share of training lines
+        seed: shuffle seed
+
+    Returns:
+        (training lines, evaluation lines)
+    """
+    os.makedirs(output_dir.as_posix(), exist_ok=True)
+    files = sorted(file.as_posix() for file in lstmf_files)
+    random.Random(seed).shuffle(files)
+    train = int(len(files) * ratio_train)
+    for name, rows in (('all-lstmf', files), ('list.train', files[:train]), ('list.eval', files[train:])):
+        with open(output_dir.joinpath(name).as_posix(), 'w', encoding='utf-8') as f:
+            f.writelines(row + '\n' for row in rows)
+    return train, len(files) - train
+
+
+def prepare_training(ground_truth_dir: Path, output_dir: Path, jobs: int = 1, psm: int = 13,
+                     ratio_train: float = 0.9, seed: int = 0) -> bool:
+    """
+    Builds .box and .lstmf files of all lines in parallel and writes the tesstrain list files, so make only has to
+    run the training. Lines with unchanged image and text are skipped, their files are touched to stay up to date
+    for make. Image and text are only hashed if their mtime or size changed since the last run.
+
+    Args:
+        ground_truth_dir: folder with line images and .gt.txt files
+        output_dir: tesstrain output folder (<data_dir>/<model_name>)
+        jobs: number of tesseract workers
+        psm: page segmentation mode of the lines
+        ratio_train: share of training lines
+        seed: shuffle seed of the list files
+
+    Returns:
+        True if list files were written
+    """
+    cache = LstmfCache(ground_truth_dir, psm)
+    lines, tasks = {}, []
+    for gt_file in sorted(ground_truth_dir.glob('*.gt.txt')):
+        image = line_image(gt_file)
+        if image is None:
+            print(f'{gt_file.name}: missing line image')
+            continue
+        base = gt_file.as_posix()[:-len('.gt.txt')]
+        name = os.path.basename(base)
+        stats = [file_stat(image), file_stat(gt_file)]
+        old = cache.lines.get(name)
+        hashes = old[:2] if old is not None and old[2:] == stats else [file_hash(image), file_hash(gt_file)]
+        lines[name] = hashes + stats
+        if old is not None and old[:2] == hashes and os.path.isfile(base + '.lstmf') and os.path.isfile(base + '.box'):
+            os.utime(base + '.box')
+            os.utime(base + '.lstmf')
+        else:
+            tasks.append((base, image, psm))
+    print(f'{len(lines) - len(tasks)} unchanged line(s) skipped, {len(tasks)} line(s) to prepare')
+
+    failed = 0
+    if tasks:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+            for (base, _, _), error in ordered_imap(pool, lstmf_worker, tasks, depth=4 * jobs):
+                if error is not None:
+                    print(f'{os.path.basename(base)}: {error}')
+                    lines.pop(os.path.basename(base))
+                    failed += 1
+    if failed:
+        print(f'{failed} line(s) failed')
+
+    cache.lines = lines
+    cache.save()
+    if not lines:
+        print('No lines prepared')
+        return False
+    train, evaluation = write_lists([Path(ground_truth_dir.joinpath(name + '.lstmf')) for name in lines],
+                                    output_dir, ratio_train, seed)
+    print(f'{train} training line(s), {evaluation} evaluation line(s)')
+    return True
+
+
+def parse_progress(line: str) -> Optional[dict]:
+    """
+    Parses a single lstmtraining log line
+
+    Args:
+        line: log line
+
+    Returns:
+        event dict (type iteration, eval or finished), None for other lines
+    """
+    match = ITERATION_PATTERN.search(line)
+    if match is not None:
+        event = {
+            'type': 'iteration',
+            'iteration': int(match.group(1)),  # learning iteration
+            'training_iteration': int(match.group(2)),
+            'sample_iteration': int(match.group(3)),
+            'rms': float(match.group(4)),
+            'delta': float(match.group(5)),
+            'bcer': float(match.group(6)),
+            'bwer': float(match.group(7)),
+            'skip_ratio': float(match.group(8)),
+            'checkpoint': 'wrote checkpoint' in line,
+            'best_model': None,
+        }
+        best = BEST_PATTERN.search(line)
+        if best is not None:
+            event['best_model'] = best.group(2)
+        return event
+
+    match = EVAL_PATTERN.search(line)
+    if match is not None:
+        return {'type': 'eval', 'iteration': int(match.group(1)), 'stage': int(match.group(2)),
+                'cer': float(match.group(3)), 'wer': float(match.group(4))}
+
+    match = FINISHED_PATTERN.search(line)
+    if match is not None:
+        return {'type': 'finished', 'bcer': float(match.group(1))}
+    return None
+
+
+def format_progress(event: dict, best: tuple) -> str:
+    """
+    Single line progress display of an event
+
+    Args:
+        event: parsed event
+        best: (best BCER, iteration)
+
+    Returns:
+        progress string
+    """
+    if event['type'] == 'iteration':
+        text = (f'Iteration {event["iteration"]}: BCER {event["bcer"]:.3f}%, BWER {event["bwer"]:.3f}%, '
+                f'best BCER {best[0]:.3f}% @ {best[1]}')
+        return text + (', checkpoint' if event['checkpoint'] else '')
+    if event['type'] == 'eval':
+        return f'Eval @ {event["iteration"]}: CER {event["cer"]:.3f}%, WER {event["wer"]:.3f}%'
+    return f'Finished: BCER {event["bcer"]:.3f}%'
+
+
+@dataclass()
+class EarlyStopping:
+    patience: int = 0  # iterations without BCER improvement, 0 disables
+    min_delta: float = 0.05  # BCER improvement in percentage points that resets the patience
+    target_bcer: Optional[float] = None  # BCER in percent, that has to be reached ...
+    target_iteration: int = 0  # ... at this iteration
+    best_bcer: float = math.inf
+    best_iteration: int = 0
+
+    def update(self, event: dict) -> Optional[str]:
+        """
+        Checks an iteration event
+
+        Args:
+            event: parsed event
+
+        Returns:
+            reason to stop, None to continue
+        """
+        if event['type'] != 'iteration':
+            return None
+        iteration, bcer = event['iteration'], event['bcer']
+        if bcer < self.best_bcer - self.min_delta or self.best_bcer == math.inf:
+            self.best_bcer, self.best_iteration = bcer, iteration
+        if self.patience and iteration - self.best_iteration >= self.patience:
+            return (f'BCER did not improve by {self.min_delta} for {iteration - self.best_iteration} iteration(s) '
+                    f'(best {self.best_bcer:.3f}% @ {self.best_iteration})')
+        if self.target_bcer is not None and iteration >= self.target_iteration and bcer > self.target_bcer:
+            return f'BCER {bcer:.3f}% missed target {self.target_bcer:.3f}% at iteration {iteration}'
+        return None
+
+
+def run_training(cmd: str, log_file: Path, stopping: EarlyStopping = None) -> tuple:
+    """
+    Runs the training command, streams and parses its output. Parsed events are printed as progress and appended
+    to a JSONL log, the process group is terminated if early stopping triggers.
+
+    Args:
+        cmd: shell command (make training ...)
+        log_file: JSONL file, events are appended
+        stopping: early stopping rules
+
+    Returns:
+        (return code, reason of early stopping or None)
+    """
+    stopping = stopping or EarlyStopping()
+    os.makedirs(log_file.parent.as_posix(), exist_ok=True)
+    reason = None
+    with open(log_file.as_posix(), 'a', encoding='utf-8') as log:
+        log.write(json.dumps({'type': 'start', 'time': time.time(), 'command': cmd}) + '\n')
+        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                errors='replace', bufsize=1, start_new_session=True)
+        eof = False
+        try:
+            for line in proc.stdout:
+                event = parse_progress(line)
+                if event is None:
+                    print(line, end='')
+                    continue
+                reason = stopping.update(event)
+                print(format_progress(event, (stopping.best_bcer, stopping.best_iteration)))
+                log.write(json.dumps(dict(event, time=time.time())) + '\n')
+                log.flush()
+                if reason is not None:
+                    log.write(json.dumps({'type': 'stopped', 'time': time.time(), 'reason': reason}) + '\n')
+                    break
+            else:
+                eof = True
+        finally:
+            if not eof:
+                _terminate(proc)  # early stopping or interrupted, make runs in its own session
+            proc.stdout.close()
+        returncode = proc.wait()
+    return returncode, reason
+
+
+def _terminate(proc: subprocess.Popen) -> None:
+    """
+    Terminates make and lstmtraining (whole process group)
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
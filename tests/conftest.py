@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).absolute().parent.parent
+sys.path.insert(0, ROOT.as_posix())
+sys.path.insert(0, ROOT.joinpath('benchmarks').as_posix())  # corpus generator and benchmark helpers
@@ -0,0 +1,76 @@
+"""evaluate_text against dinglehopper (CER, WER) on texts of many scripts and random edits of them"""
+import math
+import random
+
+import dinglehopper
+import pytest
+
+from tesspage.eval import evaluate_text
+
+SAMPLES = [
+    'The quick brown fox jumps over the lazy dog.',
+    'Größe, Maß und Übermut – Æsir œuvre ſchön',
+    'été ño ǟ',  # combining marks
+    'line one\r\nline two\r\n',
+    'ශ්‍රී ලංකාව ශා x සිංහල',  # Sinhala spacing marks and ZWJ
+    '؀12 abc ؅١٢ ܏ܐܒ ࢐࢑ x',  # prepend characters
+    'مرحبا بالعالم، كيف حالك؟',
+    'שָׁלוֹם עוֹלָם',
+    'नमस्ते दुनिया क्षत्रिय',
+    'বাংলা ভাষা ক্ষ',
+    'தமிழ் மொழி க்ஷ',
+    'สวัสดีชาวโลก ที่นี่',
+    'ສະບາຍດີ ໂລກ',
+    'བོད་ཡིག་ བཀྲ་ཤིས།',
+    'မြန်မာ ဘာသာ',
+    'ភាសាខ្មែរ សួស្តី',
+    '한국어 한글 텍스트',  # precomposed and conjoining jamo
+    '日本語のテキスト 漢字 ｶﾀｶﾅ ﾊﾞ',
+    'Ελληνικά κείμενα ῶ ᾷ',
+    'Русский текст й ё',
+    '👨‍👩‍👧 👍🏽 🇩🇪🇫🇷 ✌️',
+]
+EDITS = 50  # random edited pairs per sample
+
+
+def edit(text: str, rng: random.Random, alphabet: str) -> str:
+    """
+    Random code point level insertions, deletions and substitutions
+    """
+    chars = list(text)
+    for _ in range(rng.randint(1, 4)):
+        op, pos = rng.randrange(3), rng.randrange(len(chars) + 1)
+        if op == 0:
+            chars.insert(pos, rng.choice(alphabet))
+        elif chars and pos < len(chars):
+            if op == 1:
+                del chars[pos]
+            else:
+                chars[pos] = rng.choice(alphabet)
+    return ''.join(chars)
+
+
+def same(a: float, b: float) -> bool:
+    return a == b or (math.isinf(a) and math.isinf(b)) or abs(a - b) < 1e-9
+
+
+def check(gt: str, pred: str) -> None:
+    result = evaluate_text(gt, pred)
+    cer = dinglehopper.character_error_rate(gt, pred)
+    # word_error_rate(str, str) splits with words() and calls this, its dispatch fails with some multimethod versions
+    wer, _ = dinglehopper.word_error_rate_n(list(dinglehopper.words(gt)), list(dinglehopper.words(pred)))
+    assert same(result.cer, cer), f'{gt!r} / {pred!r}: CER {result.cer} != {cer}'
+    assert same(result.wer, wer), f'{gt!r} / {pred!r}: WER {result.wer} != {wer}'
+
+
+@pytest.mark.parametrize('gt, pred', [(a, b) for a in SAMPLES for b in SAMPLES[:3]] + [('', 'x'), ('x', ''), ('', '')])
+def test_pairs(gt: str, pred: str):
+    check(gt, pred)
+
+
+@pytest.mark.parametrize('index', range(len(SAMPLES)))
+def test_edits(index: int):
+    text = SAMPLES[index]
+    rng = random.Random(index)
+    for _ in range(EDITS):
+        check(text, edit(text, rng, ''.join(SAMPLES)))
@@ -0,0 +1,90 @@
+"""PageXML parser backends (lxml, bs4) on a synthetic corpus and handwritten edge cases"""
+import io
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import pytest
+
+from corpus import CorpusConfig, write_corpus
+from tesspage.pagexml_parser import parse_pagexml
+
+NAMESPACES = (
+    'http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15',
+    'http://schema.primaresearch.org/PAGE/gts/pagecontent/2019-07-15',
+)
+
+
+def page_document(namespace: str, body: str) -> str:
+    return (f'<?xml version="1.0" encoding="UTF-8"?>\n<PcGts xmlns="{namespace}"><Metadata><Creator>check</Creator>'
+            '<Created>2024-01-01T00:00:00</Created><LastChange>2024-01-01T00:00:00</LastChange></Metadata>'
+            f'<Page imageFilename="page.png" imageWidth="1000" imageHeight="800">{body}</Page></PcGts>\n')
+
+
+def line(line_id: str, y: int, text: str, words: str = '') -> str:
+    return (f'<TextLine id="{line_id}"><Coords points="10,{y} 900,{y} 900,{y + 30} 10,{y + 30}"/>{words}'
+            f'<TextEquiv><Unicode>{text}</Unicode></TextEquiv></TextLine>')
+
+
+def region(region_id: str, y: int, content: str) -> str:
+    return f'<TextRegion id="{region_id}"><Coords points="0,{y} 1000,{y} 1000,{y + 300} 0,{y + 300}"/>{content}</TextRegion>'
+
+
+# name -> PageXML body, parsed equally by both backends
+SAME = {
+    'plain': region('r0', 0, line('l0', 10, 'Erste Zeile') + line('l1', 50, 'ſchöne &amp; „Zeile“')),
+    'empty_text': region('r0', 0, line('l0', 10, '')),
+    'missing_coords': region('r0', 0, '<TextLine id="l0"><TextEquiv><Unicode>x</Unicode></TextEquiv></TextLine>'
+                             + line('l1', 50, 'kept')),
+    'bad_coords': region('r0', 0, '<TextLine id="l0"><Coords points="1,2 3"/><TextEquiv><Unicode>x</Unicode>'
+                         '</TextEquiv></TextLine>' + line('l1', 50, 'kept')),
+    'empty_region': region('r0', 0, '') + region('r1', 400, line('l0', 410, 'x')),
+}
+
+# name -> (PageXML body, lxml texts per region), the documented differences of the lxml backend (see README)
+DIFFERENT = {
+    'word_text': (region('r0', 0, line('l0', 10, 'line text', '<Word id="w0"><Coords points="10,10 90,10 90,40 10,40"/>'
+                                                          '<TextEquiv><Unicode>word</Unicode></TextEquiv></Word>')),
+                  {'r0': ['line text']}),
+    'nested_region': (region('r0', 0, line('l0', 10, 'outer') + region('r1', 100, line('l1', 110, 'inner'))),
+                      {'r0': ['outer'], 'r1': ['inner']}),
+}
+
+
+def parse(path: Path, backend: str):
+    with redirect_stdout(io.StringIO()):  # parser error messages
+        return parse_pagexml(path, backend)
+
+
+def texts(doc) -> dict:
+    return {region.id: [line.text for line in region.text_lines] for page in doc.pages for region in page.text_regions}
+
+
+@pytest.fixture(scope='module')
+def corpus(tmp_path_factory) -> list:
+    folder = tmp_path_factory.mktemp('corpus')
+    write_corpus(folder, CorpusConfig(pages=10, width=800, height=1200))
+    return sorted(folder.joinpath('pagexml').glob('*.xml')) + sorted(folder.joinpath('eval').glob('*.xml'))
+
+
+def test_corpus(corpus: list):
+    assert corpus
+    assert [file.name for file in corpus if parse(file, 'lxml') != parse(file, 'bs4')] == []
+
+
+@pytest.mark.parametrize('namespace', NAMESPACES)
+@pytest.mark.parametrize('name', list(SAME))
+def test_same(name: str, namespace: str, tmp_path: Path):
+    file = tmp_path.joinpath(f'{name}.xml')
+    file.write_text(page_document(namespace, SAME[name]), encoding='utf-8')
+    assert parse(file, 'lxml') == parse(file, 'bs4')
+
+
+@pytest.mark.parametrize('namespace', NAMESPACES)
+@pytest.mark.parametrize('name', list(DIFFERENT))
+def test_different(name: str, namespace: str, tmp_path: Path):
+    body, expected = DIFFERENT[name]
+    file = tmp_path.joinpath(f'{name}.xml')
+    file.write_text(page_document(namespace, body), encoding='utf-8')
+    lxml_doc = parse(file, 'lxml')
+    assert lxml_doc != parse(file, 'bs4')
+    assert texts(lxml_doc) == expected
@@ -0,0 +1,24 @@
+"""CLI startup budget, benchmarks/bench_startup.py prints the full report"""
+from pathlib import Path
+
+import pytest
+
+from bench_startup import CLI, HEAVY, best_profile, scenarios
+
+BUDGET = 50  # ms of imports for --help, unpack and tesseract
+HEAVY_BUDGET = 600  # ms of imports for generate, eval and index
+REPEAT = 5  # best run counts
+
+
+@pytest.fixture(scope='module')
+def baseline() -> tuple:
+    return best_profile(['-c', 'pass'], REPEAT)  # interpreter and site imports
+
+
+@pytest.mark.parametrize('name', list(scenarios(Path())))
+def test_startup(name: str, baseline: tuple, tmp_path: Path):
+    cli_args, allowed, light = scenarios(tmp_path)[name]
+    total, packages = best_profile([CLI.as_posix()] + cli_args, REPEAT)
+    unexpected = sorted(p for p in HEAVY if p in packages - baseline[1] and p not in allowed)
+    assert not unexpected, f'{name} imports {", ".join(unexpected)}'
+    assert (total - baseline[0]) / 1000 <= (BUDGET if light else HEAVY_BUDGET)